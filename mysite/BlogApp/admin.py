@@ -1,23 +1,28 @@
 from django.contrib import admin
 
 
+from shopapp.admin_mixin import ExportAsCSVMixin
 from .models import Article, Author, Tag, Category
 
 @admin.register(Article)
-class ArticleAdmin(admin.ModelAdmin):
-     list_display = "id", "title", "pub_date", "content"
+class ArticleAdmin(admin.ModelAdmin, ExportAsCSVMixin):
+    actions = "exropt_csv",
+    list_display = "id", "title", "pub_date", "excerpt", "reading_time"
 
 
 @admin.register(Author)
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(admin.ModelAdmin, ExportAsCSVMixin):
+    actions = "exropt_csv",
     list_display = "name", "bio"
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(admin.ModelAdmin, ExportAsCSVMixin):
+    actions = "exropt_csv",
     list_display = "name",
 
 
 @admin.register(Tag)
-class TagAdmin(admin.ModelAdmin):
+class TagAdmin(admin.ModelAdmin, ExportAsCSVMixin):
+    actions = "exropt_csv",
     list_display = "name",
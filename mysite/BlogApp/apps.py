@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using, **kwargs):
+    from .search import ARTICLE_INDEX
+
+    ARTICLE_INDEX.install(connections[using])
 
 
 class BlogappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'BlogApp'
+
+    def ready(self):
+        from . import signals
+        post_migrate.connect(install_search_index, sender=self)
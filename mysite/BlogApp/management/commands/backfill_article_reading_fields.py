@@ -0,0 +1,35 @@
+from django.core.management import BaseCommand
+from BlogApp.models import Article, ARTICLES_TAG, ARTICLE_CARDS_TAG, READING_FIELDS
+from mysite.cache_tags import bump_tags
+
+
+class Command(BaseCommand):
+    """
+    Recomputes stored article excerpts, word counts and reading times in batches
+    """
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.stdout.write("Backfill article reading fields")
+
+        last_pk = 0
+        updated = 0
+        while True:
+            articles = list(
+                Article.objects
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", "content")[:options["batch_size"]]
+            )
+            if not articles:
+                break
+            for article in articles:
+                article.update_reading_fields()
+            # bulk_update keeps updated_at and sends no signals: cards and feeds are invalidated below
+            updated += Article.objects.bulk_update(articles, READING_FIELDS)
+            last_pk = articles[-1].pk
+            self.stdout.write(f"Updated {updated} articles")
+
+        bump_tags(ARTICLES_TAG, ARTICLE_CARDS_TAG)
+        self.stdout.write(self.style.SUCCESS("DONE"))
@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+from BlogApp.models import Category, Tag, update_article_counts
+
+
+class Command(BaseCommand):
+    """
+    Repairs stored category and tag article counts in batches
+    """
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.stdout.write("Recompute article counts")
+
+        for model, argument in ((Category, "categories"), (Tag, "tags")):
+            last_pk = 0
+            updated = 0
+            while True:
+                pks = list(
+                    model.objects
+                    .filter(pk__gt=last_pk)
+                    .order_by("pk")
+                    .values_list("pk", flat=True)[:options["batch_size"]]
+                )
+                if not pks:
+                    break
+                updated += update_article_counts(**{argument: model.objects.filter(pk__in=pks)})
+                last_pk = pks[-1]
+                self.stdout.write(f"Updated {updated} {argument}")
+
+        self.stdout.write(self.style.SUCCESS("DONE"))
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BlogApp', '0002_alter_article_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['-pub_date', '-id'], name='blogapp_article_pub_date_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+from django.db import migrations
+
+# The index as it was created here; BlogApp.search.ARTICLE_INDEX reinstalls
+# missing triggers after every migrate
+FTS_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS blogapp_article_fts USING fts5("
+    "title, content, content='BlogApp_article', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS blogapp_article_fts_ai AFTER INSERT ON BlogApp_article "
+    "BEGIN INSERT INTO blogapp_article_fts(rowid, title, content) "
+    "VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS blogapp_article_fts_ad AFTER DELETE ON BlogApp_article "
+    "BEGIN INSERT INTO blogapp_article_fts(blogapp_article_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS blogapp_article_fts_au AFTER UPDATE OF title, content ON BlogApp_article "
+    "BEGIN INSERT INTO blogapp_article_fts(blogapp_article_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO blogapp_article_fts(rowid, title, content) "
+    "VALUES (new.id, new.title, new.content); END",
+    "INSERT INTO blogapp_article_fts(blogapp_article_fts) VALUES ('rebuild')",
+]
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS blogapp_article_fts_ai",
+    "DROP TRIGGER IF EXISTS blogapp_article_fts_ad",
+    "DROP TRIGGER IF EXISTS blogapp_article_fts_au",
+    "DROP TABLE IF EXISTS blogapp_article_fts",
+]
+
+
+def run_sqlite(statements):
+    # FTS5 is SQLite only, other backends search with icontains
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BlogApp', '0003_article_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FTS_SQL), run_sqlite(DROP_SQL)),
+    ]
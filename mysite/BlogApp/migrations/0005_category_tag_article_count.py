@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_article_counts(apps, schema_editor):
+    Article = apps.get_model("BlogApp", "Article")
+    Category = apps.get_model("BlogApp", "Category")
+    Tag = apps.get_model("BlogApp", "Tag")
+    in_category = (
+        Article.objects
+        .filter(category=OuterRef("pk"), pub_date__isnull=False)
+        .order_by()
+        .values("category")
+    )
+    Category.objects.update(article_count=Coalesce(
+        Subquery(in_category.annotate(count=Count("pk")).values("count")),
+        Value(0),
+    ))
+    tagged = (
+        Article.tags.through.objects
+        .filter(tag=OuterRef("pk"), article__pub_date__isnull=False)
+        .order_by()
+        .values("tag")
+    )
+    Tag.objects.update(article_count=Coalesce(
+        Subquery(tagged.annotate(count=Count("pk")).values("count")),
+        Value(0),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BlogApp', '0004_article_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='article_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='article_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['category', '-pub_date', '-id'], name='blogapp_article_cat_pub_idx'),
+        ),
+        migrations.RunPython(fill_article_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:09
+import math
+
+from django.db import migrations
+
+EXCERPT_LENGTH = 200
+WORDS_PER_MINUTE = 200
+BATCH_SIZE = 500
+
+
+def fill_reading_fields(apps, schema_editor):
+    # Same as Article.update_reading_fields(), which historical models lack
+    Article = apps.get_model("BlogApp", "Article")
+    last_pk = 0
+    while True:
+        articles = list(
+            Article.objects.filter(pk__gt=last_pk).order_by("pk").only("pk", "content")[:BATCH_SIZE]
+        )
+        if not articles:
+            break
+        for article in articles:
+            words = article.content.split()
+            article.excerpt = " ".join(words)[:EXCERPT_LENGTH]
+            article.word_count = len(words)
+            article.reading_time = math.ceil(len(words) / WORDS_PER_MINUTE)
+        Article.objects.bulk_update(articles, ["excerpt", "word_count", "reading_time"])
+        last_pk = articles[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BlogApp', '0006_article_reading_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_reading_fields, migrations.RunPython.noop),
+    ]
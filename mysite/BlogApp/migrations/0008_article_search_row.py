@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:50
+
+import django.db.models.deletion
+import mysite.fts
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BlogApp', '0007_fill_article_reading_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleSearchRow',
+            fields=[
+                ('article', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_row', serialize=False, to='BlogApp.article')),
+                ('document', mysite.fts.DocumentField(db_column='blogapp_article_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'blogapp_article_fts',
+                'managed': False,
+            },
+        ),
+    ]
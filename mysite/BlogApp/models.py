@@ -1,24 +1,129 @@
+import math
+
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 
+from mysite.fts import DocumentField
+
+
+# Cache tags, see mysite.cache_tags
+ARTICLES_TAG = "article:*"
+# Cached article cards; they are keyed on updated_at, so this is only
+# bumped by writes that bypass it (bulk backfills) and by changes to
+# authors, categories and tags shown on many cards
+ARTICLE_CARDS_TAG = "article-card:*"
+EXCERPT_LENGTH = 200
+WORDS_PER_MINUTE = 200
+# Derived from content by Article.save()
+READING_FIELDS = ("excerpt", "word_count", "reading_time")
+
 class Author(models.Model):
     name = models.CharField(max_length=100)
     bio = models.TextField(null=False, blank=True)
 
 class Category(models.Model):
     name = models.CharField(max_length=40)
+    # Published articles, kept by BlogApp.signals (see update_article_counts)
+    article_count = models.PositiveIntegerField(default=0, db_index=True)
+
+    def get_absolute_url(self):
+        return reverse("BlogApp:category", kwargs={"pk": self.pk})
 
 class Tag(models.Model):
     name = models.CharField(max_length=20)
+    # Published articles, kept by BlogApp.signals (see update_article_counts)
+    article_count = models.PositiveIntegerField(default=0, db_index=True)
+
+    def get_absolute_url(self):
+        return reverse("BlogApp:tag", kwargs={"pk": self.pk})
 
 class Article(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["-pub_date", "-id"], name="blogapp_article_pub_date_idx"),
+            models.Index(fields=["category", "-pub_date", "-id"], name="blogapp_article_cat_pub_idx"),
+        ]
+
     title = models.CharField(max_length=200)
     content = models.TextField(null=False, blank=True)
     pub_date = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveIntegerField(default=0, editable=False, help_text="Minutes")
     author = models.ForeignKey(Author, on_delete=models.CASCADE, null=False)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     tags = models.ManyToManyField(Tag)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to recount the previous category, see BlogApp.signals
+        if "category_id" in instance.__dict__:
+            instance._loaded_category_id = instance.category_id
+        return instance
+
     def get_absolute_url(self):
         return reverse("BlogApp:article", kwargs={"pk": self.pk})
 
+    def update_reading_fields(self):
+        """
+        Set excerpt, word count and reading time from content
+        """
+        words = self.content.split()
+        self.excerpt = " ".join(words)[:EXCERPT_LENGTH]
+        self.word_count = len(words)
+        self.reading_time = math.ceil(len(words) / WORDS_PER_MINUTE)
+
+    def save(self, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "content" in update_fields:
+            self.update_reading_fields()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, *READING_FIELDS}
+        super().save(**kwargs)
+
+
+
+def update_article_counts(categories=None, tags=None) -> int:
+    """
+    Recompute stored ``article_count`` for categories and tags querysets
+    """
+    published = Article.objects.filter(pub_date__isnull=False).order_by()
+    updated = 0
+    if categories is not None:
+        in_category = published.filter(category=OuterRef("pk")).values("category")
+        updated += categories.update(article_count=Coalesce(
+            Subquery(in_category.annotate(count=Count("pk")).values("count")),
+            Value(0),
+        ))
+    if tags is not None:
+        tagged = (
+            Article.tags.through.objects
+            .filter(tag=OuterRef("pk"), article__pub_date__isnull=False)
+            .order_by()
+            .values("tag")
+        )
+        updated += tags.update(article_count=Coalesce(
+            Subquery(tagged.annotate(count=Count("pk")).values("count")),
+            Value(0),
+        ))
+    return updated
+
+
+class ArticleSearchRow(models.Model):
+    """
+    Row of the article full-text index, joined to rank searches, see BlogApp.search
+    """
+
+    class Meta:
+        managed = False
+        db_table = "blogapp_article_fts"
+
+    article = models.OneToOneField(
+        Article, on_delete=models.DO_NOTHING, primary_key=True, db_column="rowid", related_name="search_row",
+    )
+    document = DocumentField(db_column="blogapp_article_fts")
+    rank = models.FloatField()
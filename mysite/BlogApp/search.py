@@ -0,0 +1,53 @@
+from django.db import connections
+from django.db.models import Q
+from django.utils.html import escape
+
+from mysite.fts import FTSIndex, fts_available
+from .models import Article
+
+ARTICLE_INDEX = FTSIndex(
+    table="blogapp_article_fts",
+    content_table="BlogApp_article",
+    columns=("title", "content"),
+    relation="search_row",
+    weights=(10.0, 1.0),
+)
+SNIPPET_TOKENS = 24
+
+
+def search_articles(text: str, offset=0, limit=20):
+    """
+    One page of published articles matching text, best bm25 rank first.
+
+    Returns ``(articles, has_more)``. Articles carry ``title_html`` and
+    ``snippet_html``: escaped title and a short content excerpt with the
+    matches in ``<mark>``. Article bodies are not loaded; without FTS
+    this falls back to ``icontains`` and the stored excerpt.
+    """
+    queryset = (
+        Article.objects
+        .filter(pub_date__isnull=False)
+        .only("pk", "title", "pub_date", "excerpt", "reading_time")
+    )
+    connection = connections[queryset.db]
+    if not fts_available(connection):
+        queryset = (
+            queryset
+            .filter(Q(title__icontains=text) | Q(content__icontains=text))
+            .order_by("-pub_date", "-pk")
+        )
+        articles = list(queryset[offset:offset + limit + 1])
+        for article in articles:
+            article.title_html = escape(article.title)
+            article.snippet_html = escape(article.excerpt)
+    else:
+        articles = list(ARTICLE_INDEX.search(queryset, text)[offset:offset + limit + 1])
+        highlights = ARTICLE_INDEX.highlights(
+            connection, text, [article.pk for article in articles[:limit]],
+            {"title": None, "content": SNIPPET_TOKENS},
+        )
+        for article in articles:
+            marked = highlights.get(article.pk, {})
+            article.title_html = marked.get("title", escape(article.title))
+            article.snippet_html = marked.get("content", "")
+    return articles[:limit], len(articles) > limit
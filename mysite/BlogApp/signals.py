@@ -0,0 +1,91 @@
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from mysite.cache_tags import bump_tags
+from mysite.sitemap_files import schedule_rebuild
+from .models import Article, Author, Category, Tag, ARTICLES_TAG, ARTICLE_CARDS_TAG, update_article_counts
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def article_changed(sender, instance: Article, raw=False, **kwargs):
+    bump_tags(ARTICLES_TAG)
+    if not raw:
+        schedule_rebuild("blog")
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def article_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Cached article cards are keyed on updated_at, which m2m changes do not touch
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # A tag may be on any number of articles: drop every card instead of rewriting them
+        bump_tags(ARTICLE_CARDS_TAG)
+    else:
+        Article.objects.filter(pk=instance.pk).update(updated_at=Now())
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def article_relation_renamed(sender, instance, created, raw=False, **kwargs):
+    # Every card showing the name is dropped, without writing to the articles
+    if created or raw:
+        return
+    bump_tags(ARTICLE_CARDS_TAG)
+
+
+@receiver(pre_save, sender=Article)
+def article_counts_pre_save(sender, instance: Article, raw=False, **kwargs):
+    instance._old_category_id = None
+    if instance._state.adding or raw:
+        return
+    if hasattr(instance, "_loaded_category_id"):
+        # Set by Article.from_db
+        instance._old_category_id = instance._loaded_category_id
+    else:
+        instance._old_category_id = (
+            Article.objects.filter(pk=instance.pk).values_list("category_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Article)
+def article_counts_post_save(sender, instance: Article, created, raw=False, **kwargs):
+    if raw:
+        return
+    category_ids = {instance.category_id, getattr(instance, "_old_category_id", None)} - {None}
+    # A new article has no tags yet, they are counted on m2m_changed
+    tags = None if created else Tag.objects.filter(article=instance)
+    update_article_counts(Category.objects.filter(pk__in=category_ids), tags)
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(pre_delete, sender=Article)
+def article_counts_pre_delete(sender, instance: Article, **kwargs):
+    # The tag links are gone by post_delete and their removal sends no m2m_changed
+    instance._tag_ids = list(instance.tags.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Article)
+def article_counts_post_delete(sender, instance: Article, **kwargs):
+    update_article_counts(
+        Category.objects.filter(pk=instance.category_id),
+        Tag.objects.filter(pk__in=getattr(instance, "_tag_ids", [])),
+    )
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def article_tags_counts_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            update_article_counts(tags=Tag.objects.filter(pk=instance.pk))
+        return
+
+    if action == "pre_clear":
+        instance._cleared_tag_ids = list(instance.tags.values_list("pk", flat=True))
+    elif action == "post_clear":
+        update_article_counts(tags=Tag.objects.filter(pk__in=instance._cleared_tag_ids))
+    elif action in ("post_add", "post_remove"):
+        update_article_counts(tags=Tag.objects.filter(pk__in=pk_set))
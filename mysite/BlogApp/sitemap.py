@@ -7,7 +7,7 @@ class BlogSitemap(Sitemap):
     priority = 0.5
 
     def items(self):
-        return Article.objects.filter(pub_date__isnull=False).order_by("-pub_date")
+        return Article.objects.filter(pub_date__isnull=False).only("pk", "pub_date").order_by("pk")
 
     def lastmod(self, obj: Article):
         return obj.pub_date
@@ -1,3 +1,324 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Article, Author, Category, Tag
+from .views import ArticleListView
+
+
+class LatestArticleFeedTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name="Ann")
+        self.category = Category.objects.create(name="News")
+        for index in range(3):
+            self.create_article(f"Article {index}")
+        self.url = reverse("BlogApp:articles-feed")
+
+    def create_article(self, title):
+        return Article.objects.create(
+            title=title,
+            content="x" * 1000,
+            author=self.author,
+            category=self.category,
+        )
+
+    def get(self, **headers):
+        return self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0', **headers)
+
+    def test_feed_is_rendered_once(self):
+        with self.assertNumQueries(1):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("x" * 200 + "<", response.content.decode())
+        self.assertNotIn("x" * 201, response.content.decode())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().content, response.content)
+        with self.assertNumQueries(0):
+            not_modified = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_query_string_does_not_render_again(self):
+        response = self.get()
+        with self.assertNumQueries(0):
+            other = self.client.get(self.url, {"x": "1"}, HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(other.content, response.content)
+
+    def test_article_save_regenerates_feed(self):
+        etag = self.get()["ETag"]
+        self.create_article("Fresh news")
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Fresh news", response.content.decode())
+
+
+class ArticleListViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name="Ann")
+        self.category = Category.objects.create(name="News")
+        self.tag = Tag.objects.create(name="django")
+        self.articles = []
+        for index in range(5):
+            article = Article.objects.create(
+                title=f"Article {index}", author=self.author, category=self.category,
+            )
+            article.tags.add(self.tag)
+            self.articles.append(article)
+        self.url = reverse("BlogApp:articles")
+
+    def get(self, url=None):
+        return self.client.get(url or self.url, HTTP_USER_AGENT='Mozilla/5.0')
+
+    def test_keyset_pages(self):
+        self.addCleanup(setattr, ArticleListView, "page_size", ArticleListView.page_size)
+        ArticleListView.page_size = 2
+
+        titles = []
+        url = self.url
+        while url:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            titles += [article.title for article in response.context["object_list"]]
+            url = response.context["next_url"] and self.url + response.context["next_url"]
+        self.assertEqual(titles, [f"Article {index}" for index in reversed(range(5))])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.get(self.url + "?before=nonsense").status_code, 404)
+
+    def test_keyset_pages_within_one_millisecond(self):
+        self.addCleanup(setattr, ArticleListView, "page_size", ArticleListView.page_size)
+        ArticleListView.page_size = 1
+        base = timezone.now().replace(microsecond=123000)
+        for article, microseconds in zip(self.articles, (900, 600, 300, 100, 0)):
+            Article.objects.filter(pk=article.pk).update(pub_date=base + timedelta(microseconds=microseconds))
+
+        titles = []
+        url = self.url
+        while url:
+            response = self.get(url)
+            titles += [article.title for article in response.context["object_list"]]
+            url = response.context["next_url"] and self.url + response.context["next_url"]
+        self.assertEqual(titles, [f"Article {index}" for index in range(5)])
+
+    def test_cards_are_cached_until_changed(self):
+        # Page keys, missing articles with author and category, their tags
+        with self.assertNumQueries(3):
+            response = self.get()
+        self.assertContains(response, "Article 4")
+        self.assertContains(response, "django")
+
+        with self.assertNumQueries(1):
+            cached = self.get()
+        self.assertEqual(cached.content, response.content)
+
+        updated_at = [article.updated_at for article in Article.objects.order_by("pk")]
+        self.tag.name = "python"
+        self.tag.save()
+        # Renames drop the cards without touching the articles
+        self.assertEqual([article.updated_at for article in Article.objects.order_by("pk")], updated_at)
+        article = self.articles[0]
+        article.title = "Renamed"
+        article.save()
+        response = self.get()
+        self.assertContains(response, "Renamed")
+        self.assertContains(response, "python")
+        self.assertNotContains(response, "django")
+
+    def test_cards_follow_author_and_tag_changes(self):
+        self.get()
+        self.author.name = "Bob"
+        self.author.save()
+        self.assertContains(self.get(), "Author: Bob")
+
+        other = Tag.objects.create(name="python")
+        other.article_set.add(*self.articles[:2])
+        self.assertContains(self.get(), "python", count=2)
+        self.articles[0].tags.remove(other)
+        self.assertContains(self.get(), "python", count=1)
+
+    def test_cards_are_cached_per_language_and_time_zone(self):
+        Article.objects.update(pub_date=datetime(2026, 10, 18, 22, 30, tzinfo=dt_timezone.utc))
+
+        response = self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0', HTTP_ACCEPT_LANGUAGE="en")
+        self.assertContains(response, "Oct. 18, 2026, 10:30 p.m.")
+
+        response = self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0', HTTP_ACCEPT_LANGUAGE="ru")
+        self.assertNotContains(response, "Oct. 18")
+
+        with timezone.override("Asia/Tokyo"):
+            response = self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0', HTTP_ACCEPT_LANGUAGE="en")
+        self.assertContains(response, "Oct. 19, 2026, 7:30 a.m.")
+
+
+class ArticleSearchTestCase(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name="Ann")
+        category = Category.objects.create(name="News")
+        self.lamps = Article.objects.create(
+            title="Lamps", content="All about <b>light</b>.", author=author, category=category,
+        )
+        self.desks = Article.objects.create(
+            title="Desks", content="A desk needs a good lamp.", author=author, category=category,
+        )
+
+    def search(self, text):
+        response = self.client.get(
+            reverse("BlogApp:article-search-json"), {"q": text}, HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        return response.json()["results"]
+
+    def test_ranked_with_title_first(self):
+        self.assertEqual([result["pk"] for result in self.search("lamp")], [self.lamps.pk, self.desks.pk])
+
+    def test_match_runs_once_per_query(self):
+        # The ranked page and its highlights
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual([result["pk"] for result in self.search("lamp")], [self.lamps.pk, self.desks.pk])
+        searches = [query["sql"] for query in queries if "MATCH" in query["sql"]]
+        self.assertEqual(len(searches), 2)
+        for sql in searches:
+            self.assertEqual(sql.count("MATCH"), 1, sql)
+
+    def test_highlights_are_escaped(self):
+        results = self.search("light")
+        self.assertEqual(results[0]["title_html"], "Lamps")
+        self.assertIn("&lt;b&gt;<mark>light</mark>&lt;/b&gt;", results[0]["snippet_html"])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.desks.content = "Nothing here"
+        self.desks.save()
+        self.assertEqual([result["pk"] for result in self.search("lamp")], [self.lamps.pk])
+
+        self.lamps.delete()
+        self.assertEqual(self.search("lamp"), [])
+
+    def test_search_page(self):
+        response = self.client.get(
+            reverse("BlogApp:article-search"), {"q": "desk"}, HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertContains(response, "<mark>Desks</mark>", html=False)
+
+
+class ArticleCountsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name="Ann")
+        self.news = Category.objects.create(name="News")
+        self.howto = Category.objects.create(name="Howto")
+        self.django = Tag.objects.create(name="django")
+        self.python = Tag.objects.create(name="python")
+
+    def create_article(self, title, category, *tags):
+        article = Article.objects.create(title=title, author=self.author, category=category)
+        article.tags.add(*tags)
+        return article
+
+    def assertCounts(self, news, howto, django, python):
+        self.assertEqual(
+            [
+                Category.objects.get(pk=self.news.pk).article_count,
+                Category.objects.get(pk=self.howto.pk).article_count,
+                Tag.objects.get(pk=self.django.pk).article_count,
+                Tag.objects.get(pk=self.python.pk).article_count,
+            ],
+            [news, howto, django, python],
+        )
+
+    def test_counts_follow_writes(self):
+        first = self.create_article("First", self.news, self.django, self.python)
+        second = self.create_article("Second", self.news, self.django)
+        self.assertCounts(2, 0, 2, 1)
+
+        second.category = self.howto
+        second.save()
+        self.assertCounts(1, 1, 2, 1)
+
+        first.tags.remove(self.python)
+        self.django.article_set.clear()
+        self.assertCounts(1, 1, 0, 0)
+
+        second.tags.add(self.python)
+        first.delete()
+        self.assertCounts(0, 1, 0, 1)
+
+    def test_save_does_not_select_previous_category(self):
+        self.create_article("First", self.news)
+        article = Article.objects.get(title="First")
+        with CaptureQueriesContext(connection) as context:
+            article.category = self.howto
+            article.save()
+        selects = [
+            query["sql"] for query in context.captured_queries
+            if query["sql"].startswith("SELECT") and 'FROM "BlogApp_article"' in query["sql"]
+        ]
+        self.assertEqual(selects, [])
+        self.assertCounts(0, 1, 0, 0)
+
+        article.category = self.news
+        article.save()
+        self.assertCounts(1, 0, 0, 0)
+
+    def test_repair_command(self):
+        self.create_article("First", self.news, self.django)
+        Category.objects.update(article_count=7)
+        Tag.objects.update(article_count=7)
+        call_command("recompute_article_counts", stdout=StringIO())
+        self.assertCounts(1, 0, 1, 0)
+
+    def test_archive_list_views(self):
+        self.create_article("First", self.news, self.django)
+        self.create_article("Second", self.howto, self.python)
+
+        response = self.client.get(reverse("BlogApp:categories"), HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertContains(response, "News</a> (1)")
+
+        response = self.client.get(reverse("BlogApp:tag", kwargs={"pk": self.python.pk}), HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual([article.title for article in response.context["object_list"]], ["Second"])
+        self.assertContains(response, "python (1 articles)")
+
+        response = self.client.get(reverse("BlogApp:category", kwargs={"pk": 0}), HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response.status_code, 404)
+
+
+class ArticleReadingFieldsTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="Long read",
+            content="word " * 450,
+            author=Author.objects.create(name="Ann"),
+            category=Category.objects.create(name="News"),
+        )
+
+    def test_computed_on_save(self):
+        self.assertEqual(self.article.word_count, 450)
+        self.assertEqual(self.article.reading_time, 3)
+        self.assertEqual(len(self.article.excerpt), 200)
+
+        self.article.content = "Short\n\n  text"
+        self.article.save(update_fields=["content"])
+        self.article.refresh_from_db()
+        self.assertEqual(
+            (self.article.excerpt, self.article.word_count, self.article.reading_time),
+            ("Short text", 2, 1),
+        )
+
+    def test_backfill_command(self):
+        cache.clear()
+        Article.objects.update(excerpt="", word_count=0, reading_time=0)
+        self.assertContains(self.client.get(reverse("BlogApp:articles"), HTTP_USER_AGENT='Mozilla/5.0'), "0 min read")
 
-# Create your tests here.
+        call_command("backfill_article_reading_fields", stdout=StringIO())
+        # Cards cached before the backfill are not served any more
+        self.assertContains(self.client.get(reverse("BlogApp:articles"), HTTP_USER_AGENT='Mozilla/5.0'), "3 min read")
+        self.article.refresh_from_db()
+        self.assertEqual((self.article.word_count, self.article.reading_time), (450, 3))
+        self.assertTrue(self.article.excerpt.startswith("word word"))
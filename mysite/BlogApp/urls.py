@@ -2,12 +2,24 @@ from django.urls import path
 from .views import  (ArticleListView,
                      ArticleDetailView,
                      LatestArticleFeed,
+                     ArticleSearchView,
+                     ArticleSearchJSONView,
+                     CategoryArticleListView,
+                     CategoryListView,
+                     TagArticleListView,
+                     TagListView,
                      )
 
 app_name = "BlogApp"
 
 urlpatterns = [
     path("articles/", ArticleListView.as_view(), name="articles"),
+    path("articles/search/", ArticleSearchView.as_view(), name="article-search"),
+    path("articles/search.json", ArticleSearchJSONView.as_view(), name="article-search-json"),
     path("articles/<int:pk>/", ArticleDetailView.as_view(), name="article"),
+    path("categories/", CategoryListView.as_view(), name="categories"),
+    path("categories/<int:pk>/", CategoryArticleListView.as_view(), name="category"),
+    path("tags/", TagListView.as_view(), name="tags"),
+    path("tags/<int:pk>/", TagArticleListView.as_view(), name="tag"),
     path("articles/latest/feed/", LatestArticleFeed(), name="articles-feed"),
 ]
@@ -1,34 +1,227 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
 from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
-from django.views.generic import ListView, DetailView
-from .models import Article
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
+from django.utils.timezone import get_current_timezone_name
+from django.utils.translation import get_language
+from django.views.generic import ListView, DetailView, TemplateView
+from mysite.cache_tags import DEFAULT_TIMEOUT, make_key
+from mysite.feeds import CachedFeedMixin
+from mysite.metrics import CACHE_REQUESTS
+from .models import Article, Category, Tag, ARTICLES_TAG, ARTICLE_CARDS_TAG
+from .search import search_articles
 
 
 class ArticleListView(ListView):
-    queryset = (
-        Article.objects
-        .select_related("author", "category")
-        .prefetch_related("tags")
-        .defer("content")
-        .filter(pub_date__isnull=False)
-        .order_by("-pub_date")
-    )
+    """
+    Published articles, newest first, in keyset pages of ``page_size``.
+
+    A page is one query on the ``(pub_date, id)`` index for the keys and
+    modification time of its articles, wherever it is in the archive.
+    Each card is cached under its article's ``updated_at`` (and the active
+    language and time zone), so only
+    articles changed since the last render are loaded and rendered again.
+    """
+    page_size = 20
+    cursor_query_param = "before"
+    card_template_name = "BlogApp/article_card.html"
+    queryset = Article.objects.filter(pub_date__isnull=False).order_by("-pub_date", "-pk")
+
+    def decode_cursor(self):
+        encoded = self.request.GET.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            pub_date, pk = parse_datetime(pub_date), int(pk)
+        except (TypeError, ValueError):
+            raise Http404("Invalid cursor")
+        if pub_date is None:
+            raise Http404("Invalid cursor")
+        return pub_date, pk
+
+    @staticmethod
+    def encode_cursor(article) -> str:
+        # Full microsecond precision: the cursor must equal the stored pub_date
+        data = json.dumps([article.pub_date.isoformat(), article.pk]).encode()
+        return urlsafe_b64encode(data).decode("ascii")
+
+    def get_page(self, queryset, page_size):
+        cursor = self.decode_cursor()
+        if cursor is not None:
+            pub_date, pk = cursor
+            queryset = queryset.filter(Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+        page = list(queryset.only("pk", "pub_date", "updated_at")[:page_size + 1])
+        has_next = len(page) > page_size
+        return page[:page_size], has_next, cursor is not None
+
+    # Change with article_card.html, so cards cached by an older release are not served
+    card_version = 2
+
+    def card_key(self, prefix: str, article) -> str:
+        return f"{prefix}:{article.pk}:{article.updated_at.timestamp()}"
+
+    def card_prefix(self) -> str:
+        # Cards show localized dates: one copy per language and time zone
+        name = f"blog:article-card:v{self.card_version}:{get_language()}:{get_current_timezone_name()}"
+        return make_key(name, [ARTICLE_CARDS_TAG])
+
+    def render_cards(self, page) -> list:
+        prefix = self.card_prefix()
+        keys = [self.card_key(prefix, article) for article in page]
+        cards = cache.get_many(keys)
+        missing = [article.pk for article, key in zip(page, keys) if key not in cards]
+        CACHE_REQUESTS.inc("article-card", "hit", amount=len(page) - len(missing))
+        if missing:
+            CACHE_REQUESTS.inc("article-card", "miss", amount=len(missing))
+            articles = (
+                Article.objects
+                .select_related("author", "category")
+                .prefetch_related("tags")
+                .only(
+                    "pk", "title", "pub_date", "updated_at", "excerpt", "reading_time",
+                    "author__name", "category__name",
+                )
+                .in_bulk(missing)
+            )
+            rendered = {
+                self.card_key(prefix, article): render_to_string(self.card_template_name, {"article": article})
+                for article in articles.values()
+            }
+            cache.set_many(rendered, timeout=DEFAULT_TIMEOUT)
+            cards.update(rendered)
+        return [mark_safe(cards[key]) for key in keys if key in cards]
+
+    def get_context_data(self, **kwargs):
+        page, has_next, has_previous = self.get_page(self.object_list, self.page_size)
+        next_url = None
+        if has_next:
+            next_url = "?" + urlencode({self.cursor_query_param: self.encode_cursor(page[-1])})
+        return super().get_context_data(
+            object_list=page,
+            cards=self.render_cards(page),
+            next_url=next_url,
+            is_paginated=has_next or has_previous,
+            **kwargs,
+        )
+
+
+class ArchiveArticleListView(ArticleListView):
+    """
+    Articles of one category or tag (``archive_model``); its stored
+    ``article_count`` is shown instead of counting the articles
+    """
+    archive_model = None
+    archive_lookup = None
+
+    def get_queryset(self):
+        self.archive = get_object_or_404(self.archive_model, pk=self.kwargs["pk"])
+        return super().get_queryset().filter(**{self.archive_lookup: self.archive})
+
+    def get_context_data(self, **kwargs):
+        return super().get_context_data(archive=self.archive, **kwargs)
+
+
+class CategoryArticleListView(ArchiveArticleListView):
+    # Paged on the (category, pub_date, id) index
+    archive_model = Category
+    archive_lookup = "category"
+
+
+class TagArticleListView(ArchiveArticleListView):
+    archive_model = Tag
+    archive_lookup = "tags"
+
+
+class CategoryListView(ListView):
+    template_name = "BlogApp/archive_list.html"
+    queryset = Category.objects.filter(article_count__gt=0).order_by("-article_count", "name")
+    extra_context = {"archive_title": "Categories"}
+
+
+class TagListView(ListView):
+    template_name = "BlogApp/archive_list.html"
+    queryset = Tag.objects.filter(article_count__gt=0).order_by("-article_count", "name")
+    extra_context = {"archive_title": "Tags"}
+
+
+class ArticleSearchView(TemplateView):
+    """
+    Ranked full-text search over published articles, ``?q=<text>&page=<n>``
+    """
+    template_name = "BlogApp/article_search.html"
+    page_size = 20
+
+    def get_search(self):
+        query = self.request.GET.get("q", "").strip()
+        try:
+            page = max(int(self.request.GET.get("page", 1)), 1)
+        except ValueError:
+            raise Http404("Invalid page")
+        articles, has_next = [], False
+        if query:
+            articles, has_next = search_articles(query, (page - 1) * self.page_size, self.page_size)
+        return query, page, articles, has_next
+
+    def page_url(self, query, page):
+        return "?" + urlencode({"q": query, "page": page})
+
+    def get_context_data(self, **kwargs):
+        query, page, articles, has_next = self.get_search()
+        return super().get_context_data(
+            query=query,
+            articles=articles,
+            next_url=self.page_url(query, page + 1) if has_next else None,
+            previous_url=self.page_url(query, page - 1) if page > 1 else None,
+            **kwargs,
+        )
+
+
+class ArticleSearchJSONView(ArticleSearchView):
+    def get(self, request, *args, **kwargs):
+        query, page, articles, has_next = self.get_search()
+        return JsonResponse({
+            "query": query,
+            "next": self.page_url(query, page + 1) if has_next else None,
+            "results": [
+                {
+                    "pk": article.pk,
+                    "url": article.get_absolute_url(),
+                    "title": article.title,
+                    "pub_date": article.pub_date,
+                    "reading_time": article.reading_time,
+                    "rank": getattr(article, "search_rank", None),
+                    "title_html": article.title_html,
+                    "snippet_html": article.snippet_html,
+                }
+                for article in articles
+            ],
+        })
+
 
 class ArticleDetailView(DetailView):
     model = Article
 
 
-class LatestArticleFeed(Feed):
+class LatestArticleFeed(CachedFeedMixin, Feed):
     title = "Blog articles (latest)"
     description = 'Update of changes and additions blog articles'
     link = reverse_lazy("BlogApp:articles")
+    cache_tags = [ARTICLES_TAG]
 
     def items(self):
         return (
             Article.objects
-            .select_related("author", "category")
-            .prefetch_related("tags")
-            .defer("content")
+            .only("pk", "title", "pub_date", "excerpt")
             .filter(pub_date__isnull=False)
             .order_by("-pub_date")[:5]
         )
@@ -37,4 +230,4 @@ class LatestArticleFeed(Feed):
         return item.title
 
     def item_description(self, item):
-        return item.content[:200]
+        return item.excerpt
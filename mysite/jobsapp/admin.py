@@ -0,0 +1,43 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = "pk", "task", "status", "progress_verbose", "throughput_verbose", "user", "created_at", "finished_at"
+    list_display_links = "pk", "task",
+    list_filter = "status", "task",
+    list_select_related = "user",
+    readonly_fields = [
+        "task",
+        "kwargs",
+        "file",
+        "status",
+        "total",
+        "processed",
+        "checkpoint",
+        "progress_verbose",
+        "throughput_verbose",
+        "result",
+        "error",
+        "user",
+        "created_at",
+        "started_at",
+        "heartbeat_at",
+        "attempts",
+        "finished_at",
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="Progress")
+    def progress_verbose(self, obj: Job) -> str:
+        if obj.progress is None:
+            return f"{obj.processed}"
+        return f"{obj.processed}/{obj.total} ({obj.progress:.0%})"
+
+    @admin.display(description="Rows/sec")
+    def throughput_verbose(self, obj: Job) -> str:
+        return f"{obj.throughput:.1f}"
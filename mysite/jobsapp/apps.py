@@ -0,0 +1,16 @@
+from importlib import import_module
+
+from django.apps import AppConfig
+from django.conf import settings
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsappConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobsapp'
+
+    def ready(self):
+        autodiscover_modules("tasks")
+        # Tasks living outside of apps
+        for module in getattr(settings, "JOBS_TASK_MODULES", ()):
+            import_module(module)
@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from django.core.management import BaseCommand
+from django.db import connections
+
+from jobsapp.tasks import STALE_AFTER, claim_next_job, heartbeat, requeue_stale_jobs, run_job
+
+HEARTBEAT_INTERVAL = STALE_AFTER.total_seconds() / 5
+
+
+def run_job_in_worker(pk: int):
+    try:
+        run_job(pk)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """
+    Runs queued jobs in a pool of threads or processes
+    """
+    help = "Process queued background jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if options["pool"] == "process":
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=connections.close_all,
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+
+        self.stdout.write(f"Start {workers} {options['pool']} workers")
+        running = {}
+        last_heartbeat = 0
+        with executor:
+            while True:
+                if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    # Jobs of this runner stay claimed; those of dead runners are taken back
+                    heartbeat(running.values())
+                    requeue_stale_jobs()
+                    last_heartbeat = time.monotonic()
+
+                while len(running) < workers:
+                    pk = claim_next_job()
+                    if pk is None:
+                        break
+                    self.stdout.write(f"Run job #{pk}")
+                    running[executor.submit(run_job_in_worker, pk)] = pk
+
+                if not running:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                done, _ = wait(running, timeout=options["poll_interval"], return_when=FIRST_COMPLETED)
+                for future in done:
+                    pk = running.pop(future)
+                    if future.exception() is not None:
+                        self.stderr.write(f"Job #{pk} crashed: {future.exception()}")
+                    else:
+                        self.stdout.write(f"Job #{pk} finished")
+
+        self.stdout.write(self.style.SUCCESS("DONE"))
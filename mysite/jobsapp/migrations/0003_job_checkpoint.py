@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobsapp', '0002_job_heartbeat_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='checkpoint',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    Background job stored in the database and run by ``run_workers``
+    """
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    task = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    file = models.FileField(null=True, blank=True, upload_to="jobs/")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    # Task-defined position of the last committed work, e.g. CSV line;
+    # kept when the job is requeued so the task resumes after it
+    checkpoint = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched by the worker while the job runs, see jobsapp.tasks.requeue_stale_jobs
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job(pk={self.pk}, task={self.task!r}, status={self.status})"
+
+    @property
+    def progress(self):
+        if not self.total:
+            return None
+        return min(self.processed / self.total, 1.0)
+
+    @property
+    def throughput(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        seconds = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return self.processed / seconds if seconds > 0 else 0.0
+
+    def add_progress(self, count: int, checkpoint: int = None):
+        values = {"processed": F("processed") + count, "heartbeat_at": timezone.now()}
+        if checkpoint is not None:
+            values["checkpoint"] = checkpoint
+            self.checkpoint = checkpoint
+        Job.objects.filter(pk=self.pk).update(**values)
+        self.processed += count
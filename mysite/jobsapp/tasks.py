@@ -0,0 +1,116 @@
+"""
+Registry and runner for database-backed background jobs.
+
+Apps register callables in their ``tasks`` module with :func:`task`,
+views put work on the queue with :func:`enqueue` and the
+``run_workers`` command executes it.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+log = logging.getLogger(__name__)
+
+TASKS = {}
+# A running job is given up when its worker sends no heartbeat for this long
+STALE_AFTER = getattr(settings, "JOBS_STALE_AFTER", timedelta(minutes=5))
+MAX_ATTEMPTS = 3
+
+
+def task(name: str):
+    """
+    Register function as job task, it is called as ``func(job, **job.kwargs)``
+    """
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name: str, file=None, user=None, total=None, **kwargs) -> Job:
+    if name not in TASKS:
+        raise KeyError(f"Unknown task {name!r}")
+    job = Job(task=name, kwargs=kwargs, total=total)
+    if user is not None and user.is_authenticated:
+        job.user = user
+    if file is not None:
+        job.file.save(file.name, file, save=False)
+    job.save()
+    return job
+
+
+def claim_next_job():
+    """
+    Mark the oldest queued job as running and return its pk
+    """
+    with transaction.atomic():
+        pk = (
+            Job.objects
+            .filter(status=Job.Status.QUEUED)
+            .order_by("created_at", "pk")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if pk is None:
+            return None
+        now = timezone.now()
+        claimed = (
+            Job.objects
+            .filter(pk=pk, status=Job.Status.QUEUED)
+            .update(status=Job.Status.RUNNING, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1)
+        )
+    return pk if claimed else None
+
+
+def heartbeat(pks):
+    """
+    Mark running jobs as alive
+    """
+    Job.objects.filter(pk__in=pks, status=Job.Status.RUNNING).update(heartbeat_at=timezone.now())
+
+
+def requeue_stale_jobs(stale_after=STALE_AFTER) -> int:
+    """
+    Put running jobs without a heartbeat for stale_after back on the queue,
+    their worker died. Jobs that were tried MAX_ATTEMPTS times fail instead.
+
+    Jobs with a checkpoint keep their progress and resume after it, the
+    others start over, so their tasks must be safe to run again.
+    """
+    stale = Job.objects.filter(status=Job.Status.RUNNING, heartbeat_at__lt=timezone.now() - stale_after)
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=Job.Status.FAILED,
+        error="Worker stopped without finishing the job",
+        finished_at=timezone.now(),
+    )
+    requeued = stale.filter(checkpoint=0).update(
+        status=Job.Status.QUEUED, started_at=None, heartbeat_at=None, processed=0,
+    )
+    requeued += stale.update(status=Job.Status.QUEUED, started_at=None, heartbeat_at=None)
+    if failed or requeued:
+        log.warning("Requeued %s and failed %s stale jobs", requeued, failed)
+    return requeued
+
+
+def run_job(pk: int) -> Job:
+    job = Job.objects.get(pk=pk)
+    func = TASKS.get(job.task)
+    try:
+        if func is None:
+            raise KeyError(f"Unknown task {job.task!r}")
+        job.result = func(job, **job.kwargs)
+        job.status = Job.Status.DONE
+    except Exception:
+        log.exception("Job %s failed", job.pk)
+        job.error = traceback.format_exc()
+        job.status = Job.Status.FAILED
+    job.finished_at = timezone.now()
+    job.save(update_fields=["result", "status", "error", "finished_at"])
+    return job
@@ -0,0 +1,131 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from mysite.test_runner import TEST_MEDIA_ROOT
+from shopapp import admin as shop_admin
+from shopapp.common import IMPORT_BATCH_SIZE
+from shopapp.models import Product
+from .models import Job
+from .tasks import MAX_ATTEMPTS, enqueue, claim_next_job, requeue_stale_jobs, run_job
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class JobQueueTestCase(TestCase):
+    def test_import_job_runs_and_reports_progress(self):
+        csv_file = SimpleUploadedFile(
+            "products.csv",
+            b"name,price\nLamp,10\nChair,bad\nTable,20\n",
+        )
+        job = enqueue("shopapp.import_products_csv", file=csv_file, encoding="utf-8")
+
+        self.assertEqual(job.status, Job.Status.QUEUED)
+        self.assertEqual(claim_next_job(), job.pk)
+        self.assertIsNone(claim_next_job())
+
+        job = run_job(job.pk)
+
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual(job.processed, 3)
+        self.assertEqual(job.result["created"], 2)
+        self.assertEqual(job.result["rejected"], 1)
+        self.assertTrue(Product.objects.filter(name="Table").exists())
+
+    def test_failed_job_keeps_traceback(self):
+        job = enqueue("shopapp.set_products_archived", pks=None, archived=True)
+        job = run_job(job.pk)
+
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertIn("Traceback", job.error)
+
+    def test_unknown_task(self):
+        with self.assertRaises(KeyError):
+            enqueue("shopapp.missing")
+
+    def test_job_of_dead_worker_is_requeued(self):
+        job = enqueue("shopapp.set_products_archived", pks=[], archived=True)
+        self.assertEqual(claim_next_job(), job.pk)
+        self.assertEqual(requeue_stale_jobs(), 0)
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(claim_next_job(), job.pk)
+
+        Job.objects.filter(pk=job.pk).update(
+            attempts=MAX_ATTEMPTS, heartbeat_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(requeue_stale_jobs(), 0)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.Status.FAILED)
+
+    def test_requeued_import_resumes_after_committed_chunks(self):
+        class WorkerKilled(BaseException):
+            pass
+
+        rows = IMPORT_BATCH_SIZE + 100
+        csv_file = SimpleUploadedFile(
+            "products.csv",
+            ("name,price\n" + "".join(f"Product {index},10\n" for index in range(rows))).encode(),
+        )
+        job = enqueue("shopapp.import_products_csv", file=csv_file, encoding="utf-8")
+        self.assertEqual(claim_next_job(), job.pk)
+
+        bulk_create = Product.objects.bulk_create
+        calls = []
+
+        def die_on_second_chunk(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 2:
+                raise WorkerKilled
+            return bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(Product.objects, "bulk_create", side_effect=die_on_second_chunk):
+            with self.assertRaises(WorkerKilled):
+                run_job(job.pk)
+        self.assertEqual(Product.objects.count(), IMPORT_BATCH_SIZE)
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.processed, IMPORT_BATCH_SIZE)
+        self.assertEqual(job.checkpoint, IMPORT_BATCH_SIZE + 1)
+
+        self.assertEqual(claim_next_job(), job.pk)
+        job = run_job(job.pk)
+
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual(job.processed, rows)
+        self.assertEqual(job.result["created"], 100)
+        self.assertEqual(job.result["resumed_after_line"], IMPORT_BATCH_SIZE + 1)
+        self.assertEqual(Product.objects.count(), rows)
+        self.assertEqual(Product.objects.values("name").distinct().count(), rows)
+
+    def test_archive_action_is_split_into_batches(self):
+        admin = User.objects.create_superuser(username="admin", password="qwerty")
+        self.client.force_login(admin)
+        products = Product.objects.bulk_create(Product(name=f"Product {index}") for index in range(5))
+        self.addCleanup(setattr, shop_admin, "ARCHIVE_BATCH_SIZE", shop_admin.ARCHIVE_BATCH_SIZE)
+        shop_admin.ARCHIVE_BATCH_SIZE = 2
+        response = self.client.post(
+            reverse("admin:shopapp_product_changelist"),
+            {"action": "mark_archived", "_selected_action": [product.pk for product in products]},
+            HTTP_USER_AGENT='Mozilla/5.0',
+            follow=True,
+        )
+        jobs = Job.objects.filter(task="shopapp.set_products_archived").order_by("pk")
+        self.assertEqual([len(job.kwargs["pks"]) for job in jobs], [2, 2, 1])
+        messages = [str(message) for message in response.context["messages"]]
+        self.assertEqual(len(messages), 1)
+        self.assertIn("Archive update of 5 products queued in", messages[0])
+        self.assertIn("3 jobs", messages[0])
+
+        jobs_url = reverse("admin:jobsapp_job_changelist") + (
+            f"?task=shopapp.set_products_archived&pk__gte={jobs[0].pk}&pk__lte={jobs[2].pk}"
+        )
+        response = self.client.get(jobs_url, HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["cl"].result_count, 3)
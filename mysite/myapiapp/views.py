@@ -6,6 +6,7 @@ from rest_framework.views import APIView
 from .serializers import GroupSerializer
 from rest_framework.generics import GenericAPIView, ListCreateAPIView
 from rest_framework.mixins import ListModelMixin, CreateModelMixin
+from mysite.query_planner import QueryPlannerMixin
 
 @api_view()
 def hello_world_view(request: Request) -> Response:
@@ -27,6 +28,6 @@ def hello_world_view(request: Request) -> Response:
 #         return self.list(request)
 
 
-class GroupListView(ListCreateAPIView):
+class GroupListView(QueryPlannerMixin, ListCreateAPIView):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
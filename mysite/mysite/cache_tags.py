@@ -0,0 +1,80 @@
+"""
+Tag-versioned cache keys.
+
+Every cached value is stored under a key that includes the current
+version of each of its tags (e.g. ``product:*``, ``user:42:orders``).
+Writes call :func:`bump_tags` from model signals, which changes the
+version and makes every key built from the old one unreachable (again
+when the writing transaction commits), so hot reads can be cached for
+hours and still see writes at once.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .metrics import CACHE_REQUESTS
+
+DEFAULT_TIMEOUT = getattr(settings, "CACHE_TAGGED_TIMEOUT", 6 * 60 * 60)
+TAG_KEY_PREFIX = "tag-version:"
+
+
+def new_version() -> int:
+    # Time based, so a re-created tag never reuses a version of an evicted one
+    return time.time_ns()
+
+
+def tag_versions(tags) -> list:
+    keys = [TAG_KEY_PREFIX + tag for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_tags(*tags):
+    """
+    Invalidate every key built with tags.
+
+    Inside a transaction the versions are bumped now and again on commit:
+    a reader that rebuilds a value from the pre-commit data in between
+    stores it under a version the commit makes unreachable.
+    """
+    set_new_versions(tags)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: set_new_versions(tags))
+
+
+def set_new_versions(tags):
+    # A plain set, not incr(): incr is a read-modify-write on FileBasedCache
+    # and concurrent bumps would be lost
+    version = new_version()
+    cache.set_many({TAG_KEY_PREFIX + tag: version for tag in tags}, timeout=None)
+
+
+def make_key(name: str, tags) -> str:
+    versions = ".".join(str(version) for version in tag_versions(tags))
+    return f"{name}:{versions}"
+
+
+def hashed_name(prefix: str, value: str) -> str:
+    return f"{prefix}:{hashlib.md5(value.encode()).hexdigest()}"
+
+
+def get_or_set(name: str, tags, producer, timeout=DEFAULT_TIMEOUT):
+    """
+    Return cached value for name and tags, calling producer on a miss
+    """
+    key = make_key(name, tags)
+    value = cache.get(key)
+    if value is None:
+        CACHE_REQUESTS.inc("tagged", "miss")
+        value = producer()
+        cache.set(key, value, timeout)
+    else:
+        CACHE_REQUESTS.inc("tagged", "hit")
+    return value
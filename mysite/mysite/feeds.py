@@ -0,0 +1,47 @@
+"""
+Syndication feeds rendered once and kept in the tagged cache.
+
+A feed is rendered on the first poll after one of its ``cache_tags`` is
+bumped and stored with its ETag and render time; later polls are a
+cache read, or a 304 when the reader sends the validators back.
+"""
+import hashlib
+import time
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from . import cache_tags
+
+
+class CachedFeedMixin:
+    cache_tags = ()
+
+    def render_cached(self, request, *args, **kwargs) -> dict:
+        response = super().__call__(request, *args, **kwargs)
+        return {
+            "content": response.content,
+            "content_type": response["Content-Type"],
+            "etag": quote_etag(hashlib.md5(response.content).hexdigest()),
+            "last_modified": int(time.time()),
+        }
+
+    def __call__(self, request, *args, **kwargs):
+        feed = cache_tags.get_or_set(
+            # Feeds take no query parameters: ignore them, one copy per feed URL
+            cache_tags.hashed_name("feed", f"{request.scheme}://{request.get_host()}{request.path}"),
+            self.cache_tags,
+            lambda: self.render_cached(request, *args, **kwargs),
+        )
+        not_modified = get_conditional_response(
+            request,
+            etag=feed["etag"],
+            last_modified=feed["last_modified"],
+        )
+        if not_modified is not None:
+            return not_modified
+        response = HttpResponse(feed["content"], content_type=feed["content_type"])
+        response["ETag"] = feed["etag"]
+        response["Last-Modified"] = http_date(feed["last_modified"])
+        return response
@@ -0,0 +1,186 @@
+"""
+SQLite FTS5 full-text indexes kept in sync with model tables by triggers.
+
+An index is an external-content FTS5 table over some text columns of a
+model table, so the text is not stored twice. Triggers update it on
+every INSERT/UPDATE/DELETE, including bulk_create() and update().
+On other database backends :meth:`FTSIndex.search` is not available and
+callers fall back to ``icontains`` search.
+
+Searches join the content table to the index through an unmanaged row
+model (a one-to-one on ``rowid``), so ``MATCH`` runs once per query and
+results are ordered by the index's ``rank`` column, configured to the
+weighted bm25 of the index.
+"""
+import re
+
+from django.db import models
+from django.db.models import F, FloatField, Lookup, Value
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Match markers FTS5 puts around matches, replaced after HTML escaping
+MATCH_START, MATCH_END = "\x02", "\x03"
+
+
+def match_query(text: str) -> str:
+    """
+    Turn user input into a safe FTS5 query: every word is quoted and
+    prefix-matched, words are AND-ed.
+    """
+    return " ".join(f'"{word}"*' for word in WORD_RE.findall(text))
+
+
+def mark_matches(text: str):
+    """
+    Escape text from ``highlight()``/``snippet()`` and wrap matches in ``<mark>``
+    """
+    return mark_safe(escape(text).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>"))
+
+
+def fts_available(connection) -> bool:
+    return connection.vendor == "sqlite"
+
+
+class DocumentField(models.TextField):
+    """
+    The hidden column an FTS5 table has under its own name, only used with ``__match``
+    """
+
+
+@DocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+
+class FTSIndex:
+    def __init__(self, table: str, content_table: str, columns, relation: str, weights=None, content_rowid="id"):
+        self.table = table
+        self.content_table = content_table
+        self.columns = tuple(columns)
+        # Reverse one-to-one from the content model to the row model of the index,
+        # which has a DocumentField ``document`` and a FloatField ``rank``
+        self.relation = relation
+        self.weights = tuple(weights or (1.0,) * len(self.columns))
+        self.content_rowid = content_rowid
+
+    def create_sql(self) -> list:
+        columns = ", ".join(self.columns)
+        new_values = ", ".join(f"new.{column}" for column in self.columns)
+        old_values = ", ".join(f"old.{column}" for column in self.columns)
+        delete_old = (
+            f"INSERT INTO {self.table}({self.table}, rowid, {columns}) "
+            f"VALUES ('delete', old.{self.content_rowid}, {old_values});"
+        )
+        insert_new = (
+            f"INSERT INTO {self.table}(rowid, {columns}) "
+            f"VALUES (new.{self.content_rowid}, {new_values});"
+        )
+        return [
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_ai AFTER INSERT ON {self.content_table} "
+            f"BEGIN {insert_new} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_ad AFTER DELETE ON {self.content_table} "
+            f"BEGIN {delete_old} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_au AFTER UPDATE OF {columns} ON {self.content_table} "
+            f"BEGIN {delete_old} {insert_new} END",
+        ]
+
+    def install(self, connection):
+        """
+        Create the FTS table and its triggers if missing.
+
+        Safe to call repeatedly: SQLite drops triggers when a migration
+        remakes the content table, so this also runs after every migrate.
+        """
+        if not fts_available(connection):
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [self.table],
+            )
+            created = cursor.fetchone() is None
+            if created:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+                    f"{', '.join(self.columns)}, "
+                    f"content='{self.content_table}', content_rowid='{self.content_rowid}')"
+                )
+            for statement in self.create_sql():
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {self.table}({self.table}, rank) VALUES ('rank', %s)", [self.rank_sql()])
+        if created:
+            self.rebuild(connection)
+
+    def uninstall(self, connection):
+        if not fts_available(connection):
+            return
+        with connection.cursor() as cursor:
+            for suffix in ("ai", "ad", "au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {self.table}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def rank_sql(self) -> str:
+        """
+        Ranking function stored in the index config, read as the ``rank`` column
+        """
+        weights = ", ".join(str(float(weight)) for weight in self.weights)
+        return f"bm25({weights})"
+
+    def search(self, queryset, text: str):
+        """
+        Filter queryset by FTS match, best bm25 rank first (``search_rank``)
+        """
+        query = match_query(text)
+        if not query:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+        return (
+            queryset
+            .filter(**{f"{self.relation}__document__match": query})
+            .annotate(search_rank=F(f"{self.relation}__rank"))
+            .order_by("search_rank")
+        )
+
+    def highlights(self, connection, text: str, rowids, columns) -> dict:
+        """
+        ``{rowid: {column: html}}`` with the matches of text marked.
+
+        ``columns`` maps column names to a snippet length in tokens, or
+        ``None`` for the whole value. Only the given rows are read, so
+        rank a page first and highlight just that page.
+        """
+        query = match_query(text)
+        rowids = list(rowids)
+        if not query or not rowids:
+            return {}
+        names = list(columns)
+        expressions, params = [], []
+        for name in names:
+            index = self.columns.index(name)
+            if columns[name] is None:
+                expressions.append(f"highlight({self.table}, {index}, %s, %s)")
+                params += [MATCH_START, MATCH_END]
+            else:
+                expressions.append(f"snippet({self.table}, {index}, %s, %s, %s, %s)")
+                params += [MATCH_START, MATCH_END, "…", columns[name]]
+        placeholders = ", ".join(["%s"] * len(rowids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, {', '.join(expressions)} FROM {self.table} "
+                f"WHERE {self.table} MATCH %s AND rowid IN ({placeholders})",
+                [*params, query, *rowids],
+            )
+            return {
+                row[0]: {name: mark_matches(value or "") for name, value in zip(names, row[1:])}
+                for row in cursor.fetchall()
+            }
@@ -0,0 +1,183 @@
+"""
+In-process metrics exposed at ``/metrics`` in the Prometheus text format.
+
+Counters and histograms keep plain numbers in a dict per label set, so
+recording is a lock and a couple of dict operations. Values are per
+worker process; Prometheus should scrape every process (or sum them).
+The endpoint is open to staff users and to scrapers sending the
+``METRICS_TOKEN`` setting as a bearer token.
+"""
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def escape_label(value) -> str:
+    return format_value(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value) -> str:
+    if isinstance(value, float):
+        return "+Inf" if value == float("inf") else repr(value)
+    return str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def items(self) -> list:
+        with self._lock:
+            return [(key, list(value) if isinstance(value, list) else value) for key, value in self._values.items()]
+
+    def labels(self, values) -> list:
+        return list(zip(self.labelnames, values))
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        for key, value in self.items():
+            yield f"{self.name}_total", self.labels(key), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # One count per bucket, one for +Inf, then the sum
+                state = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0]
+            state[index] += 1
+            state[-1] += value
+
+    def get(self, *labelvalues):
+        """
+        Return (count, sum) observed for the label values
+        """
+        state = self._values.get(labelvalues)
+        if state is None:
+            return 0, 0
+        return sum(state[:-1]), state[-1]
+
+    def samples(self):
+        for key, state in self.items():
+            labels = self.labels(key)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), state):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + [("le", float(bound))], cumulative
+            yield f"{self.name}_sum", labels, state[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+REQUESTS = Counter(
+    "django_http_requests",
+    "Requests by view, method and response status.",
+    ("view", "method", "status"),
+)
+EXCEPTIONS = Counter(
+    "django_http_exceptions",
+    "Unhandled view exceptions by view and exception type.",
+    ("view", "exception"),
+)
+LATENCY = Histogram(
+    "django_http_request_duration_seconds",
+    "Time spent producing the response, by view.",
+    ("view",),
+    LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "django_http_response_size_bytes",
+    "Size of non-streaming response bodies, by view.",
+    ("view",),
+    SIZE_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "django_db_queries_per_request",
+    "Database queries run per request, by view.",
+    ("view",),
+    QUERY_BUCKETS,
+)
+DB_QUERY_DURATION = Counter(
+    "django_db_query_duration_seconds",
+    "Time spent in database queries, by view.",
+    ("view",),
+)
+CACHE_REQUESTS = Counter(
+    "django_cache_requests",
+    "Cache lookups by cache and result (hit or miss).",
+    ("cache", "result"),
+)
+
+
+def has_metrics_access(request) -> bool:
+    if request.user.is_staff:
+        return True
+    token = getattr(settings, "METRICS_TOKEN", "")
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return bool(token) and scheme.lower() == "bearer" and constant_time_compare(credentials.strip(), token)
+
+
+def metrics_view(request):
+    if not has_metrics_access(request):
+        raise PermissionDenied
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
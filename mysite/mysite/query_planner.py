@@ -0,0 +1,130 @@
+"""
+Derive ``select_related`` / ``prefetch_related`` / ``only()`` from a DRF
+serializer, so list endpoints run a fixed number of queries.
+
+Forward relations rendered by a nested serializer or a dotted source
+(``user.username``) are joined with ``select_related``; to-many
+relations are prefetched, with the prefetched queryset planned the same
+way (primary key related fields load only ``pk``). Plain fields become
+the ``only()`` column list, with the ``extra_sources`` a field declares;
+if any field cannot be mapped to a model field (method fields,
+properties) all columns are loaded.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+
+class QueryPlan:
+    def __init__(self):
+        self.select_related = []
+        self.prefetch_related = []
+        self.only = set()
+        self.complete = True
+
+    def apply(self, queryset, only=True):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if only and self.complete:
+            queryset = queryset.only("pk", *sorted(self.only))
+        return queryset
+
+
+def plan_serializer(serializer, model, prefix="", plan=None) -> QueryPlan:
+    if plan is None:
+        plan = QueryPlan()
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == "*":
+            if isinstance(field, serializers.BaseSerializer):
+                plan_serializer(field, model, prefix, plan)
+            else:
+                plan.complete = False
+            continue
+        plan_field(plan, model, prefix, field)
+        # Columns a field reads besides its source
+        plan.only.update(prefix + name for name in getattr(field, "extra_sources", ()))
+    return plan
+
+
+def plan_field(plan, model, prefix, field):
+    names = field.source.split(".")
+    for depth, name in enumerate(names):
+        last = depth == len(names) - 1
+        if name == "pk":
+            name = model._meta.pk.name
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            plan.complete = False
+            return
+        path = prefix + name
+
+        if model_field.many_to_many or model_field.one_to_many:
+            plan.prefetch_related.append(
+                Prefetch(path, queryset=related_queryset(model_field, field if last else None))
+            )
+            return
+
+        if model_field.is_relation and model_field.concrete:
+            if last and not isinstance(field, serializers.BaseSerializer):
+                plan.only.add(path)
+                return
+            plan.only.add(path)
+            plan.select_related.append(path)
+            if last:
+                plan_serializer(field, model_field.related_model, path + "__", plan)
+                return
+            model, prefix = model_field.related_model, path + "__"
+            continue
+
+        if model_field.is_relation or not last:
+            # Reverse one-to-one or a lookup into a plain column value
+            plan.complete = False
+            return
+        plan.only.add(path)
+        return
+
+
+def related_queryset(model_field, field):
+    related_model = model_field.related_model
+    queryset = related_model._default_manager.all()
+    if isinstance(field, ManyRelatedField) and isinstance(field.child_relation, PrimaryKeyRelatedField):
+        plan = QueryPlan()
+    elif isinstance(field, serializers.ListSerializer):
+        plan = plan_serializer(field.child, related_model)
+    else:
+        return queryset
+    if model_field.one_to_many:
+        # Prefetch matches rows back to their parent by the foreign key
+        plan.only.add(model_field.field.name)
+    return plan.apply(queryset)
+
+
+class QueryPlannerMixin:
+    """
+    Plan the queryset of a generic view from its serializer.
+
+    Column pushdown with ``only()`` is used for read requests only; pk,
+    ``ordering_fields`` and the model's default ordering are always loaded
+    so ordering and cursor pagination do not fetch deferred columns.
+    """
+
+    def get_ordering_columns(self, model) -> set:
+        ordering_fields = getattr(self, "ordering_fields", None)
+        if not isinstance(ordering_fields, (list, tuple)):
+            ordering_fields = ()
+        fields = [*ordering_fields, *(model._meta.ordering or ())]
+        return {field.lstrip("-") for field in fields if isinstance(field, str)}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        plan = plan_serializer(self.get_serializer(), queryset.model)
+        plan.only.update(self.get_ordering_columns(queryset.model))
+        request = getattr(self, "request", None)
+        return plan.apply(queryset, only=request is not None and request.method in SAFE_METHODS)
@@ -73,9 +73,12 @@ INSTALLED_APPS = [
     "myauth.apps.MyauthConfig",
     "myapiapp.apps.MyapiappConfig",
     "BlogApp.apps.BlogappConfig",
+    "jobsapp.apps.JobsappConfig",
 ]
 
 MIDDLEWARE = [
+    'requestdataapp.middlewares.AccessLogMiddleware',
+    'requestdataapp.middlewares.MetricsMiddleware',
     # "django.middleware.cache.UpdateCacheMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -85,7 +88,6 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'requestdataapp.middlewares.set_useragent_on_request_middleware',
-    'requestdataapp.middlewares.CountRequestMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     "django.contrib.admindocs.middleware.XViewMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
@@ -123,14 +125,30 @@ DATABASES = {
     }
 }
 
-CACHE = {
+CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.dummy.DummyCache",
-        # "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
-        # "LOCATION": "/var/tmp/django_cache",
+        # "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+        # shared by web and worker processes, so tag invalidation reaches all of them
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": getenv("DJANGO_CACHE_LOCATION", "/var/tmp/django_cache"),
+        "OPTIONS": {
+            # List pages, feeds and per-article cards share the cache; the
+            # default of 300 entries makes them evict each other
+            "MAX_ENTRIES": int(getenv("DJANGO_CACHE_MAX_ENTRIES", "20000")),
+            "CULL_FREQUENCY": 10,
+        },
     }
 }
 
+# Tests run against a local memory cache, see mysite.test_runner
+TEST_RUNNER = "mysite.test_runner.IsolatedCacheTestRunner"
+
+JOBS_TASK_MODULES = [
+    "mysite.sitemap_files",
+]
+
+CACHE_TAGGED_TIMEOUT = 6 * 60 * 60
+
 CACHE_MIDDLEWARE_SECONDS = 200
 
 # Password validation
@@ -183,6 +201,18 @@ STATIC_URL = 'static/'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "uploads"
 
+SITEMAP_ROOT = getenv("DJANGO_SITEMAP_ROOT", "/var/tmp/django_sitemaps")
+SITEMAP_BASE_URL = getenv("DJANGO_SITEMAP_BASE_URL", "http://127.0.0.1:8000")
+
+STORAGES = {
+    "default": {
+        "BACKEND": "mysite.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -262,6 +292,17 @@ SPECTACULAR_SETTINGS = {
 #     },
 # }
 
+ACCESS_LOG = {
+    "PATH": getenv("DJANGO_ACCESS_LOG", ""),
+    "SAMPLE_RATE": float(getenv("DJANGO_ACCESS_LOG_SAMPLE_RATE", "1")),
+    "FIELDS": ("time", "method", "path", "view", "status", "latency_ms", "queries", "user_agent"),
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "BACKUP_COUNT": 5,
+}
+
+# Scrapers send "Authorization: Bearer <token>"; staff users need no token
+METRICS_TOKEN = getenv("DJANGO_METRICS_TOKEN", "")
+
 LOGLEVEL = getenv("DJANGO_LOGLEVEL", "info").upper()
 
 logging.config.dictConfig({
@@ -0,0 +1,233 @@
+"""
+Pre-rendered, gzip-compressed sitemaps.
+
+:func:`build_sitemaps` renders every section of :data:`mysite.sitemaps.sitemaps`
+into ``sitemap-<section>-<page>.xml.gz`` files of up to 50 000 URLs and a
+``sitemap.xml.gz`` index in ``settings.SITEMAP_ROOT``. Pages whose content
+did not change keep their file and modification time, which is what
+:func:`sitemap_file` sends as ``Last-Modified``. Product and article
+changes queue a rebuild of their section as a background job, so a
+crawler hit is one file read. Until the first build has written the
+index, the files are rendered from the database on request instead.
+"""
+import gzip
+import math
+import os
+import re
+import tempfile
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils import translation
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from jobsapp.models import Job
+from jobsapp.tasks import enqueue, task
+
+REBUILD_TASK = "sitemaps.rebuild"
+URLS_PER_FILE = 50000
+INDEX_NAME = "sitemap.xml"
+XMLNS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+SECTION_FILE_RE = re.compile(r"^sitemap-(?P<section>[\w-]+)-(?P<page>\d+)\.xml\.gz$")
+SECTION_NAME_RE = re.compile(r"^sitemap-(?P<section>[\w-]+)-(?P<page>\d+)\.xml$")
+# Set while a rebuild of the section is queued and not started yet
+QUEUED_KEY = "sitemaps:rebuild-queued:{section}"
+QUEUED_TIMEOUT = 60 * 60
+
+
+def section_file_name(section: str, page: int) -> str:
+    return f"sitemap-{section}-{page}.xml"
+
+
+def file_path(name: str) -> str:
+    return os.path.join(settings.SITEMAP_ROOT, name + ".gz")
+
+
+def w3c_date(value) -> str:
+    return value.isoformat(timespec="seconds") if hasattr(value, "hour") else value.isoformat()
+
+
+def iter_pages(sitemap, limit=URLS_PER_FILE):
+    """
+    Items of sitemap in pages of limit, by primary key without OFFSET
+    """
+    queryset = sitemap.items().order_by("pk")
+    last_pk = None
+    while True:
+        page_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        page = list(page_queryset[:limit])
+        if not page:
+            return
+        yield page
+        last_pk = page[-1].pk
+
+
+def render_urlset(sitemap, items, base_url: str) -> bytes:
+    lastmod = getattr(sitemap, "lastmod", None)
+    parts = [f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n']
+    for item in items:
+        parts.append(f"<url><loc>{escape(base_url + sitemap.location(item))}</loc>")
+        modified = lastmod(item) if callable(lastmod) else None
+        if modified:
+            parts.append(f"<lastmod>{w3c_date(modified)}</lastmod>")
+        if sitemap.changefreq:
+            parts.append(f"<changefreq>{sitemap.changefreq}</changefreq>")
+        if sitemap.priority is not None:
+            parts.append(f"<priority>{sitemap.priority}</priority>")
+        parts.append("</url>\n")
+    parts.append("</urlset>\n")
+    return "".join(parts).encode()
+
+
+def render_index(names, base_url: str, lastmod=True) -> bytes:
+    parts = [f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{XMLNS}">\n']
+    for name in names:
+        parts.append(f"<sitemap><loc>{escape(base_url)}/{name}</loc>")
+        if lastmod:
+            modified = datetime.fromtimestamp(int(os.stat(file_path(name)).st_mtime), tz=timezone.utc)
+            parts.append(f"<lastmod>{w3c_date(modified)}</lastmod>")
+        parts.append("</sitemap>\n")
+    parts.append("</sitemapindex>\n")
+    return "".join(parts).encode()
+
+
+def write_if_changed(name: str, data: bytes) -> bool:
+    path = file_path(name)
+    if os.path.exists(path):
+        with gzip.open(path, "rb") as current:
+            if current.read() == data:
+                return False
+    fd, tmp_path = tempfile.mkstemp(dir=settings.SITEMAP_ROOT)
+    with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as compressed:
+        compressed.write(data)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+    return True
+
+
+def sitemap_sections() -> list:
+    from .sitemaps import sitemaps
+
+    return list(sitemaps)
+
+
+def section_files() -> dict:
+    """
+    ``{section: [file names by page]}`` of the files on disk
+    """
+    pages = {}
+    for file_name in os.listdir(settings.SITEMAP_ROOT):
+        match = SECTION_FILE_RE.match(file_name)
+        if match:
+            pages.setdefault(match["section"], []).append(int(match["page"]))
+    return {
+        section: [section_file_name(section, page) for page in sorted(numbers)]
+        for section, numbers in pages.items()
+    }
+
+
+def build_section(section: str, sitemap, base_url: str) -> dict:
+    written = pages = 0
+    for pages, items in enumerate(iter_pages(sitemap), start=1):
+        written += write_if_changed(section_file_name(section, pages), render_urlset(sitemap, items, base_url))
+    for name in section_files().get(section, [])[pages:]:
+        os.remove(file_path(name))
+    return {"pages": pages, "written": written}
+
+
+def build_sitemaps(sections=None, base_url=None) -> dict:
+    """
+    Render the given sections (all by default) and the index
+    """
+    from .sitemaps import sitemaps
+
+    base_url = (base_url or settings.SITEMAP_BASE_URL).rstrip("/")
+    os.makedirs(settings.SITEMAP_ROOT, exist_ok=True)
+    result = {}
+    language = translation.get_supported_language_variant(settings.LANGUAGE_CODE)
+    with translation.override(language):
+        for section, sitemap_class in sitemaps.items():
+            if sections is None or section in sections:
+                result[section] = build_section(section, sitemap_class(), base_url)
+
+    names = [name for section in sorted(section_files()) for name in section_files()[section]]
+    write_if_changed(INDEX_NAME, render_index(names, base_url))
+    return result
+
+
+def render_fallback(name: str, base_url=None) -> bytes:
+    """
+    Render file name from the database, for use before the first build
+    """
+    from .sitemaps import sitemaps
+
+    base_url = (base_url or settings.SITEMAP_BASE_URL).rstrip("/")
+    language = translation.get_supported_language_variant(settings.LANGUAGE_CODE)
+    with translation.override(language):
+        if name == INDEX_NAME:
+            names = [
+                section_file_name(section, page)
+                for section, sitemap_class in sorted(sitemaps.items())
+                for page in range(1, math.ceil(sitemap_class().items().count() / URLS_PER_FILE) + 1)
+            ]
+            return render_index(names, base_url, lastmod=False)
+        match = SECTION_NAME_RE.match(name)
+        if match is None or match["section"] not in sitemaps:
+            raise Http404("No such sitemap")
+        sitemap = sitemaps[match["section"]]()
+        start = (int(match["page"]) - 1) * URLS_PER_FILE
+        items = list(sitemap.items().order_by("pk")[start:start + URLS_PER_FILE])
+        if not items:
+            raise Http404("No such sitemap")
+        return render_urlset(sitemap, items, base_url)
+
+
+@task(REBUILD_TASK)
+def rebuild_sitemaps(job: Job, sections=None) -> dict:
+    # Changes from now on need another rebuild
+    cache.delete_many([QUEUED_KEY.format(section=section) for section in sections or sitemap_sections()])
+    return build_sitemaps(sections)
+
+
+def schedule_rebuild(section: str):
+    """
+    Queue a rebuild of section when the transaction commits, unless one
+    is already queued and not started yet
+    """
+    def queue():
+        if cache.add(QUEUED_KEY.format(section=section), True, timeout=QUEUED_TIMEOUT):
+            enqueue(REBUILD_TASK, sections=[section])
+
+    transaction.on_commit(queue)
+
+
+def sitemap_file(request, name=INDEX_NAME):
+    path = file_path(name)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        if os.path.exists(file_path(INDEX_NAME)):
+            raise Http404("No such sitemap")
+        # Not built yet: serve from the database and have the files built
+        for section in sitemap_sections():
+            schedule_rebuild(section)
+        return HttpResponse(render_fallback(name), content_type="application/xml")
+    if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), int(mtime)):
+        return HttpResponseNotModified()
+
+    with open(path, "rb") as file:
+        data = file.read()
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        response = HttpResponse(data, content_type="application/xml")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(gzip.decompress(data), content_type="application/xml")
+    response["Last-Modified"] = http_date(mtime)
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
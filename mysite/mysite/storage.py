@@ -0,0 +1,217 @@
+"""
+Content-addressed media storage with deduplication.
+
+Every saved file is streamed to a temporary file under ``.blobs/`` while
+its SHA-256 is computed, then kept once as ``.blobs/<ab>/<cd>/<digest>``.
+Uploads Django already spooled to disk on the same filesystem are hashed
+and linked in place instead of being copied.
+The public name (``products/product_1/preview/desk.png``) is a hard link
+to that blob, so the link count is the reference count: saving bytes
+that are already stored costs one link, and saving them again under a
+name that already links to them is a no-op that keeps the name instead
+of adding a random suffix. The last delete of a name removes the blob,
+found by the digest kept in an extended attribute of the file. Linking
+a name to an existing blob and removing a blob take the same lock, so a
+blob is never removed while a new name is being linked to it.
+"""
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+BLOBS_DIR = ".blobs"
+LOCK_FILE = ".blobs.lock"
+DIGEST_XATTR = "user.cas.digest"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    hash_name = "sha256"
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.location, BLOBS_DIR, digest[:2], digest[2:4], digest)
+
+    def file_digest(self, path: str) -> str:
+        with open(path, "rb") as file:
+            return hashlib.file_digest(file, self.hash_name).hexdigest()
+
+    @contextmanager
+    def blob_lock(self):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.location, mode=self.directory_permissions_mode or 0o777, exist_ok=True)
+        with open(os.path.join(self.location, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def local_file(self, content):
+        """
+        Return path and digest of a file holding content that store_file()
+        may link and remove: the temporary file of an upload when it is on
+        the same filesystem, a copy written by write_temp() otherwise
+        """
+        if hasattr(content, "temporary_file_path"):
+            path = content.temporary_file_path()
+            os.makedirs(self.location, mode=self.directory_permissions_mode or 0o777, exist_ok=True)
+            if os.stat(path).st_dev == os.stat(self.location).st_dev:
+                return path, self.file_digest(path)
+        return self.write_temp(content)
+
+    def write_temp(self, content):
+        """
+        Write content to a temporary file in the blob store, return its
+        path and digest
+        """
+        tmp_dir = os.path.join(self.location, BLOBS_DIR, "tmp")
+        os.makedirs(tmp_dir, mode=self.directory_permissions_mode or 0o777, exist_ok=True)
+        digest = hashlib.new(self.hash_name)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    tmp.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest()
+
+    def install_blob(self, path: str, digest: str):
+        """
+        Make file at path the blob of digest unless it is already stored.
+
+        The blob is a hard link to path, which is left in place.
+        """
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            return
+        os.makedirs(os.path.dirname(blob), mode=self.directory_permissions_mode or 0o777, exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        try:
+            # Kept on the inode, so delete() finds the blob of any name without hashing
+            os.setxattr(path, DIGEST_XATTR, digest.encode())
+        except (AttributeError, OSError):
+            pass
+        try:
+            os.link(path, blob)
+        except FileExistsError:
+            pass
+
+    def blob_digest(self, path: str) -> str:
+        try:
+            return os.getxattr(path, DIGEST_XATTR).decode()
+        except (AttributeError, OSError):
+            return self.file_digest(path)
+
+    def links_to(self, name: str, digest: str) -> bool:
+        try:
+            return os.path.samefile(self.path(name), self.blob_path(digest))
+        except FileNotFoundError:
+            return False
+
+    def link_blob(self, digest: str, name: str, max_length=None) -> str:
+        blob = self.blob_path(digest)
+        while True:
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), mode=self.directory_permissions_mode or 0o777, exist_ok=True)
+            try:
+                with self.blob_lock():
+                    os.link(blob, path)
+            except FileExistsError:
+                if getattr(self, "_allow_overwrite", False):
+                    self.delete(name)
+                else:
+                    # A file with this name was created meanwhile
+                    name = self.get_available_name(name, max_length=max_length)
+            else:
+                return str(name).replace("\\", "/")
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        validate_file_name(name, allow_relative_path=True)
+        path, digest = self.local_file(content)
+        return self.store_file(path, digest, name, max_length)
+
+    def adopt(self, path: str, name: str, max_length=None) -> str:
+        """
+        Move a local file on the same filesystem into the store under name.
+
+        The file is only read to hash it; its bytes are never copied.
+        """
+        validate_file_name(name, allow_relative_path=True)
+        return self.store_file(path, self.file_digest(path), name, max_length)
+
+    def store_file(self, path: str, digest: str, name: str, max_length=None, available=True) -> str:
+        """
+        Link name to the blob of digest, made from file at path when missing.
+        The file at path is removed.
+        """
+        try:
+            if available:
+                if self.links_to(name, digest):
+                    return str(name).replace("\\", "/")
+                name = self.get_available_name(name, max_length=max_length)
+            while True:
+                self.install_blob(path, digest)
+                try:
+                    name = self.link_blob(digest, name, max_length=max_length)
+                    break
+                except FileNotFoundError:
+                    # The blob was deleted after install_blob() found it: install again
+                    continue
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        validate_file_name(name, allow_relative_path=True)
+        return name
+
+    def _save(self, name, content):
+        path, digest = self.local_file(content)
+        return self.store_file(path, digest, name, available=False)
+
+    def refcount(self, name: str) -> int:
+        """
+        Number of names sharing the content of name
+        """
+        return os.stat(self.path(name)).st_nlink - 1
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        path = self.path(name)
+        if os.path.isdir(path):
+            os.rmdir(path)
+            return
+        with self.blob_lock():
+            try:
+                links = os.stat(path).st_nlink
+            except FileNotFoundError:
+                return
+            # Only the blob may be left after this name goes: find it first
+            digest = self.blob_digest(path) if links == 2 else None
+            os.remove(path)
+            if digest is not None:
+                blob = self.blob_path(digest)
+                try:
+                    if os.stat(blob).st_nlink == 1:
+                        os.remove(blob)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,41 @@
+"""
+Test runner that keeps tests off the shared file cache.
+
+Tests clear and bump the cache freely; with the configured
+FileBasedCache that would wipe the cache of the running site.
+
+Tests that write files point the settings at directories under one
+temporary root, removed when the test process exits::
+
+    @override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+    class UploadTestCase(TestCase):
+        ...
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+TEST_FILES_ROOT = tempfile.mkdtemp(prefix="mysite-tests-")
+TEST_MEDIA_ROOT = os.path.join(TEST_FILES_ROOT, "media")
+TEST_SITEMAP_ROOT = os.path.join(TEST_FILES_ROOT, "sitemaps")
+atexit.register(shutil.rmtree, TEST_FILES_ROOT, ignore_errors=True)
+
+
+class IsolatedCacheTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_override = override_settings(CACHES=TEST_CACHES)
+        self.cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -15,13 +15,13 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.conf.urls.i18n import i18n_patterns
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
-from django.contrib.sitemaps.views import sitemap
-from .sitemaps import sitemaps
+from .metrics import metrics_view
+from .sitemap_files import sitemap_file
 
 urlpatterns = [
     path('admin/doc/', include("django.contrib.admindocs.urls")),
@@ -33,13 +33,10 @@ urlpatterns = [
     path("api/schema/swagger/", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger"),
     path("api/schema/redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc"),
     path("api/", include("myapiapp.urls")),
+    path("metrics", metrics_view, name="metrics"),
 
-    path(
-        "sitemap.xml",
-        sitemap,
-        {"sitemaps": sitemaps},
-        name="django.contrib.sitemaps.views.sitemap",
-    ),
+    path("sitemap.xml", sitemap_file, name="django.contrib.sitemaps.views.sitemap"),
+    re_path(r"^(?P<name>sitemap-[\w-]+-\d+\.xml)$", sitemap_file, name="sitemap-section"),
 ]
 
 urlpatterns += i18n_patterns(
@@ -0,0 +1,155 @@
+"""
+Structured access log written to a rotating JSONL file off the request path.
+
+Requests only build a small dict and ``put_nowait`` it on a bounded
+queue; a daemon thread drains the queue in batches and writes them with
+one ``write()`` call. When the queue is full records are dropped (and
+counted) instead of making requests wait for the disk.
+
+Worker processes can share one file: it is opened in append mode, its
+size is the size on disk, and rotation takes a lock file, so a process
+finding the file rotated by another one reopens it instead of rotating
+it again.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from mysite import metrics
+
+log = logging.getLogger(__name__)
+
+DROPPED = metrics.Counter(
+    "access_log_dropped_records",
+    "Access log records dropped because the queue was full.",
+)
+
+
+class AccessLogWriter:
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 queue_size=10000, batch_size=500, flush_interval=1.0):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.file = None
+        self.thread = threading.Thread(target=self.run, name="access-log-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, record: dict):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+    def flush(self):
+        """
+        Block until every submitted record is written
+        """
+        self.queue.join()
+
+    def run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception:
+                log.exception("Could not write %s access log records to %s", len(batch), self.path)
+                self.file = None
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def write(self, batch):
+        data = "".join(json.dumps(record, default=str) + "\n" for record in batch).encode()
+        if self.file is None or self.rotated_away():
+            self.open()
+        if self.max_bytes and self.size() + len(data) > self.max_bytes:
+            with self.rotation_lock():
+                if self.rotated_away():
+                    self.open()
+                elif self.size() + len(data) > self.max_bytes:
+                    self.rotate()
+        view = memoryview(data)
+        while view:
+            view = view[self.file.write(view):]
+
+    def open(self):
+        if self.file is not None:
+            self.file.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Unbuffered binary append: one write() per batch, sizes in bytes
+        self.file = open(self.path, "ab", buffering=0)
+
+    def size(self) -> int:
+        return os.fstat(self.file.fileno()).st_size
+
+    def rotated_away(self) -> bool:
+        """
+        True when the path no longer names the open file
+        """
+        try:
+            return not os.path.samestat(os.stat(self.path), os.fstat(self.file.fileno()))
+        except FileNotFoundError:
+            return True
+
+    @contextmanager
+    def rotation_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def rotate(self):
+        self.file.close()
+        if self.backup_count:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            self.path.unlink(missing_ok=True)
+        self.file = None
+        self.open()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path, **options) -> AccessLogWriter:
+    """
+    One writer thread per log file in the process
+    """
+    path = str(Path(path).resolve())
+    with _writers_lock:
+        if path not in _writers:
+            writer = _writers[path] = AccessLogWriter(path, **options)
+            atexit.register(writer.flush)
+        return _writers[path]
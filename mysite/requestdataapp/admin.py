@@ -1,4 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ChunkedUpload
 
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = "pk", "filename", "size", "offset", "status", "user", "updated_at"
+    list_filter = "status",
+    readonly_fields = "size", "offset", "file", "created_at", "updated_at"
@@ -0,0 +1,194 @@
+"""
+Resumable chunked uploads.
+
+A client creates an upload with its file name and total size, then sends
+the bytes in any number of ``PATCH`` requests. Each carries the offset
+it starts at (``Upload-Offset``) and optionally its SHA-256
+(``Upload-Checksum: sha256 <hex>``). Chunks are streamed from the request
+straight into a partial file; after a dropped connection the client asks
+for the current offset and continues from there. Once the last chunk is
+in, a background job hashes the partial file and moves it into storage
+without copying it, so the final request does not read the whole file.
+"""
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+
+from jobsapp.tasks import enqueue
+from .models import ChunkedUpload, PARTIAL_DIR
+
+READ_BLOCK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = getattr(settings, "CHUNKED_UPLOAD_MAX_CHUNK_SIZE", 64 * 1024 * 1024)
+MAX_SIZE = getattr(settings, "CHUNKED_UPLOAD_MAX_SIZE", 4 * 1024 * 1024 * 1024)
+COMPLETE_TASK = "requestdataapp.complete_upload"
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class ChunkError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_checksum(header: str):
+    if not header:
+        return None
+    algorithm, _, value = header.partition(" ")
+    if algorithm.lower() != "sha256" or len(value.strip()) != 64:
+        raise ChunkError("Upload-Checksum must be 'sha256 <hex digest>'")
+    return value.strip().lower()
+
+
+def start_upload(filename: str, size: int, user) -> ChunkedUpload:
+    if size > MAX_SIZE:
+        raise ChunkError(f"File is larger than {MAX_SIZE} bytes", 413)
+    upload = ChunkedUpload.objects.create(filename=filename, size=size, user=user)
+    os.makedirs(os.path.dirname(upload.partial_path), exist_ok=True)
+    open(upload.partial_path, "wb").close()
+    if size == 0:
+        complete_upload(upload)
+    return upload
+
+
+def claim_offset(upload: ChunkedUpload, offset: int):
+    """
+    Mark upload as being written at offset, so concurrent chunks for the
+    same offset get a 409 instead of writing into the partial file too.
+
+    A claim older than ``CLAIM_TIMEOUT`` belongs to a dead request and can
+    be taken over.
+    """
+    now = timezone.now()
+    claimed = (
+        ChunkedUpload.objects
+        .filter(pk=upload.pk, offset=offset)
+        .filter(
+            Q(status=ChunkedUpload.Status.UPLOADING)
+            | Q(status=ChunkedUpload.Status.WRITING, updated_at__lt=now - CLAIM_TIMEOUT)
+        )
+        .update(status=ChunkedUpload.Status.WRITING, updated_at=now)
+    )
+    if not claimed:
+        upload.refresh_from_db()
+        if upload.status in (ChunkedUpload.Status.PROCESSING, ChunkedUpload.Status.COMPLETE):
+            raise ChunkError("Upload is already complete", 409)
+        if upload.offset != offset:
+            raise ChunkError(f"Expected offset {upload.offset}", 409)
+        raise ChunkError("Another chunk is being written", 409)
+
+
+def release_offset(upload: ChunkedUpload, offset: int):
+    ChunkedUpload.objects.filter(pk=upload.pk, status=ChunkedUpload.Status.WRITING).update(
+        offset=offset, status=ChunkedUpload.Status.UPLOADING, updated_at=timezone.now(),
+    )
+    upload.offset, upload.status = offset, ChunkedUpload.Status.UPLOADING
+
+
+def write_chunk(path: str, stream, offset: int, length: int, checksum=None):
+    digest = hashlib.sha256()
+    with open(path, "r+b") as partial:
+        partial.seek(offset)
+        remaining = length
+        while remaining:
+            block = stream.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            partial.write(block)
+            remaining -= len(block)
+        if remaining:
+            partial.truncate(offset)
+            raise ChunkError("Chunk is shorter than Content-Length")
+        if checksum is not None and digest.hexdigest() != checksum:
+            partial.truncate(offset)
+            raise ChunkError("Chunk checksum mismatch", 460)
+        # Drop bytes left over from an interrupted earlier attempt
+        partial.truncate()
+
+
+def append_chunk(upload: ChunkedUpload, stream, offset: int, length: int, checksum=None) -> ChunkedUpload:
+    """
+    Write length bytes from stream at offset of the partial file
+    """
+    if upload.status in (ChunkedUpload.Status.PROCESSING, ChunkedUpload.Status.COMPLETE):
+        raise ChunkError("Upload is already complete", 409)
+    if length > MAX_CHUNK_SIZE or offset + length > upload.size:
+        raise ChunkError("Chunk is too large", 413)
+
+    claim_offset(upload, offset)
+    try:
+        write_chunk(upload.partial_path, stream, offset, length, checksum)
+    except BaseException:
+        release_offset(upload, offset)
+        raise
+    if offset + length == upload.size:
+        finish_upload(upload)
+    else:
+        release_offset(upload, offset + length)
+    return upload
+
+
+def finish_upload(upload: ChunkedUpload):
+    """
+    Hand the written partial file over to a job that completes the upload
+    """
+    ChunkedUpload.objects.filter(pk=upload.pk).update(
+        offset=upload.size, status=ChunkedUpload.Status.PROCESSING, updated_at=timezone.now(),
+    )
+    upload.offset, upload.status = upload.size, ChunkedUpload.Status.PROCESSING
+    enqueue(COMPLETE_TASK, user=upload.user, total=upload.size, pk=str(upload.pk))
+
+
+def expire_uploads(older_than) -> int:
+    """
+    Delete unfinished uploads not written to since ``older_than`` (a
+    timedelta) with their partial files, and partial files left without
+    an upload. Returns the number of deleted uploads.
+    """
+    expired = ChunkedUpload.objects.filter(
+        status__in=[ChunkedUpload.Status.UPLOADING, ChunkedUpload.Status.WRITING],
+        updated_at__lt=timezone.now() - older_than,
+    )
+    deleted = 0
+    for upload in expired.iterator():
+        if os.path.exists(upload.partial_path):
+            os.remove(upload.partial_path)
+        upload.delete()
+        deleted += 1
+
+    partial_dir = os.path.join(settings.MEDIA_ROOT, PARTIAL_DIR)
+    if os.path.isdir(partial_dir):
+        cutoff = time.time() - older_than.total_seconds()
+        for entry in os.scandir(partial_dir):
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            pk, _ = os.path.splitext(entry.name)
+            try:
+                orphaned = not ChunkedUpload.objects.filter(pk=pk).exists()
+            except ValidationError:
+                orphaned = True
+            if orphaned:
+                os.remove(entry.path)
+    return deleted
+
+
+def complete_upload(upload: ChunkedUpload):
+    file_field = upload.file.field
+    name = file_field.generate_filename(upload, upload.filename)
+    storage = file_field.storage
+    if hasattr(storage, "adopt"):
+        name = storage.adopt(upload.partial_path, name)
+    else:
+        with open(upload.partial_path, "rb") as partial:
+            name = storage.save(name, File(partial))
+        os.remove(upload.partial_path)
+    upload.file.name = name
+    upload.status = ChunkedUpload.Status.COMPLETE
+    upload.save(update_fields=["file", "status", "updated_at"])
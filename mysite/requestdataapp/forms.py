@@ -15,3 +15,15 @@ def validate_file_name(file: InMemoryUploadedFile) -> None:
 
 class UploadFileForm(forms.Form):
     file = forms.FileField(validators=[validate_file_name])
+
+
+def validate_chunked_file_name(name: str) -> None:
+    if "virus" in name:
+        raise ValidationError("File name should not contain 'virus'")
+    if "/" in name or "\\" in name or name in (".", ".."):
+        raise ValidationError("File name should not contain a path")
+
+
+class ChunkedUploadForm(forms.Form):
+    filename = forms.CharField(max_length=255, validators=[validate_chunked_file_name])
+    size = forms.IntegerField(min_value=0)
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from requestdataapp.chunked import expire_uploads
+
+
+class Command(BaseCommand):
+    """
+    Deletes abandoned chunked uploads and their partial files
+    """
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-hours", type=float, default=24)
+
+    def handle(self, *args, **options):
+        deleted = expire_uploads(timedelta(hours=options["older_than_hours"]))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} uploads"))
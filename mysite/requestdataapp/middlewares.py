@@ -1,38 +1,154 @@
+import random
+from time import perf_counter, time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.http import HttpRequest
 
+from mysite import metrics
+from .access_log import get_writer
+
 
 def set_useragent_on_request_middleware(get_response):
 
-    print("initial call")
     def middleware(request: HttpRequest):
-        print("before get response")
-        request.user_agent = request.META["HTTP_USER_AGENT"]
+        request.user_agent = request.META.get("HTTP_USER_AGENT", "")
         response = get_response(request)
-        print("after get response")
         return response
 
 
     return middleware
 
 
-class CountRequestMiddleware:
+class QueryCounter:
+    """
+    ``connection.execute_wrapper`` counting queries and their time
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Record request count, latency, response size and default database
+    queries per view in :mod:`mysite.metrics`.
+
+    Views are labelled by URL name, so the label set stays small;
+    unresolved URLs are counted as ``<unresolved>``.
+    """
 
     def __init__(self, get_response):
         self.get_response = get_response
-        self.request_count = 0
-        self.response_count = 0
-        self.exceptions_count = 0
+
+    @staticmethod
+    def view_name(request: HttpRequest) -> str:
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return "<unresolved>"
+        return match.view_name or match._func_path
 
     def __call__(self, request: HttpRequest):
-        self.request_count += 1
-        print(f"request count {self.request_count}")
-        response = self.get_response(request)
-        self.response_count += 1
-        print(f"responses count {self.response_count}")
+        queries = QueryCounter()
+        start = perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        duration = perf_counter() - start
+        request.query_count = queries.count
+
+        view = self.view_name(request)
+        metrics.REQUESTS.inc(view, request.method, str(response.status_code))
+        metrics.LATENCY.observe(duration, view)
+        metrics.DB_QUERIES.observe(queries.count, view)
+        metrics.DB_QUERY_DURATION.inc(view, amount=queries.duration)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.observe(len(response.content), view)
         return response
 
-    def process_exceptions(self, request: HttpRequest, exception: Exception):
-        self.exceptions_count += 1
-        print(f"Got {self.exceptions_count} exceptions so far")
+    def process_exception(self, request: HttpRequest, exception: Exception):
+        metrics.EXCEPTIONS.inc(self.view_name(request), type(exception).__name__)
+
+
+# field name: function(request, response, start time, latency in seconds)
+ACCESS_LOG_FIELDS = {
+    "time": lambda request, response, started, latency: started,
+    "method": lambda request, response, started, latency: request.method,
+    "path": lambda request, response, started, latency: request.path,
+    "view": lambda request, response, started, latency: MetricsMiddleware.view_name(request),
+    "status": lambda request, response, started, latency: response.status_code,
+    "latency_ms": lambda request, response, started, latency: round(latency * 1000, 3),
+    "queries": lambda request, response, started, latency: getattr(request, "query_count", None),
+    "user_agent": lambda request, response, started, latency: request.META.get("HTTP_USER_AGENT", ""),
+    "size": lambda request, response, started, latency: None if response.streaming else len(response.content),
+    "user": lambda request, response, started, latency: getattr(getattr(request, "user", None), "pk", None),
+}
+
 
+ACCESS_LOG_DEFAULTS = {
+    "PATH": None,
+    "SAMPLE_RATE": 1.0,
+    "FIELDS": ("time", "method", "path", "view", "status", "latency_ms", "queries", "user_agent"),
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "BACKUP_COUNT": 5,
+    "QUEUE_SIZE": 10000,
+    "BATCH_SIZE": 500,
+    "FLUSH_INTERVAL": 1.0,
+}
+
+
+class AccessLogMiddleware:
+    """
+    Queue one JSON record per sampled request for the access log writer.
+
+    Configured by ``settings.ACCESS_LOG`` (see ``ACCESS_LOG_DEFAULTS``);
+    disabled when ``PATH`` is empty. The query count comes from
+    :class:`MetricsMiddleware`, so put this middleware before it.
+    Worker processes can share one ``PATH``: each appends whole batches
+    in binary mode, and rotation is done under a lock file by whichever
+    process first sees the size limit (see ``requestdataapp.access_log``).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = {**ACCESS_LOG_DEFAULTS, **getattr(settings, "ACCESS_LOG", {})}
+        self.sample_rate = config["SAMPLE_RATE"]
+        self.fields = tuple(config["FIELDS"])
+        unknown = set(self.fields) - set(ACCESS_LOG_FIELDS)
+        if unknown:
+            raise ImproperlyConfigured(f"Unknown ACCESS_LOG fields: {', '.join(sorted(unknown))}")
+        self.writer = None
+        if config["PATH"]:
+            self.writer = get_writer(
+                config["PATH"],
+                max_bytes=config["MAX_BYTES"],
+                backup_count=config["BACKUP_COUNT"],
+                queue_size=config["QUEUE_SIZE"],
+                batch_size=config["BATCH_SIZE"],
+                flush_interval=config["FLUSH_INTERVAL"],
+            )
+
+    def __call__(self, request: HttpRequest):
+        if self.writer is None or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return self.get_response(request)
+
+        started = time()
+        start = perf_counter()
+        response = self.get_response(request)
+        latency = perf_counter() - start
+
+        # Only the configured fields are computed: "user" loads the session
+        self.writer.submit({
+            field: ACCESS_LOG_FIELDS[field](request, response, started, latency)
+            for field in self.fields
+        })
+        return response
 
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requestdataapp', '0002_chunkedupload_writing_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chunkedupload',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('writing', 'Writing'), ('processing', 'Processing'), ('complete', 'Complete')], default='uploading', max_length=10),
+        ),
+    ]
@@ -1,4 +1,41 @@
+import os
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+PARTIAL_DIR = ".partial"
+
+
+class ChunkedUpload(models.Model):
+    """
+    Resumable upload sent in chunks and appended to a partial file,
+    which becomes ``file`` once ``offset`` reaches ``size``
+    """
+
+    class Status(models.TextChoices):
+        UPLOADING = "uploading", "Uploading"
+        # A chunk is being written, see requestdataapp.chunked.append_chunk
+        WRITING = "writing", "Writing"
+        # All bytes are in, a job hashes and stores the file, see requestdataapp.tasks
+        PROCESSING = "processing", "Processing"
+        COMPLETE = "complete", "Complete"
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.UPLOADING)
+    file = models.FileField(null=True, blank=True, upload_to="chunked/")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"ChunkedUpload(pk={self.pk}, filename={self.filename!r}, offset={self.offset}/{self.size})"
 
+    @property
+    def partial_path(self) -> str:
+        # Under MEDIA_ROOT, so completion is a rename on the same filesystem
+        return os.path.join(settings.MEDIA_ROOT, PARTIAL_DIR, f"{self.pk}.part")
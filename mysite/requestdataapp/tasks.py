@@ -0,0 +1,13 @@
+from jobsapp.models import Job
+from jobsapp.tasks import task
+
+from .chunked import COMPLETE_TASK, complete_upload
+from .models import ChunkedUpload
+
+
+@task(COMPLETE_TASK)
+def complete_chunked_upload(job: Job, pk: str) -> dict:
+    upload = ChunkedUpload.objects.get(pk=pk, status=ChunkedUpload.Status.PROCESSING)
+    complete_upload(upload)
+    job.add_progress(upload.size)
+    return {"file": upload.file.name}
@@ -1,4 +1,390 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
+from jobsapp.models import Job
+from jobsapp.tasks import claim_next_job, run_job
+from mysite import metrics
+from mysite.storage import ContentAddressedStorage
+from mysite.test_runner import TEST_MEDIA_ROOT
+from . import chunked
+from .access_log import AccessLogWriter, get_writer
+from .models import ChunkedUpload
+
+
+class MetricsMiddlewareTestCase(TestCase):
+    def get(self, url):
+        return self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0')
+
+    def test_request_is_recorded(self):
+        view = "requestdataapp:get-view"
+        requests_before = metrics.REQUESTS.get(view, "GET", "200")
+        latency_before, _ = metrics.LATENCY.get(view)
+
+        response = self.get(reverse(view) + "?a=1")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(metrics.REQUESTS.get(view, "GET", "200"), requests_before + 1)
+        self.assertEqual(metrics.LATENCY.get(view)[0], latency_before + 1)
+        self.assertGreaterEqual(metrics.RESPONSE_SIZE.get(view)[1], len(response.content))
+
+    def test_unresolved_url(self):
+        before = metrics.REQUESTS.get("<unresolved>", "GET", "404")
+        self.get("/no-such-page/")
+        self.assertEqual(metrics.REQUESTS.get("<unresolved>", "GET", "404"), before + 1)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint(self):
+        self.get(reverse("metrics"))
+        response = self.client.get(
+            reverse("metrics"), HTTP_USER_AGENT='Mozilla/5.0', HTTP_AUTHORIZATION="Bearer secret",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+        self.assertIn("# TYPE django_http_request_duration_seconds histogram", text)
+        self.assertIn('django_http_requests_total{view="metrics",method="GET",status="403"}', text)
+        self.assertIn('django_http_request_duration_seconds_bucket{view="metrics",le="+Inf"}', text)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        url = reverse("metrics")
+        self.assertEqual(self.get(url).status_code, 403)
+        response = self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0', HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+
+        user = User.objects.create_user(username="viewer", password="qwerty")
+        self.client.force_login(user)
+        self.assertEqual(self.get(url).status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.get(url).status_code, 200)
+
+    def test_metrics_endpoint_without_token_setting(self):
+        response = self.client.get(reverse("metrics"), HTTP_USER_AGENT='Mozilla/5.0', HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 403)
+
+
+class MetricsFormatTestCase(TestCase):
+    def test_histogram_samples_are_cumulative(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", ("view",), (0.1, 1.0), registry=metrics.Registry())
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, 'a"b')
+        samples = [(name, dict(labels).get("le"), value) for name, labels, value in histogram.samples()]
+        self.assertEqual(samples, [
+            ("test_seconds_bucket", 0.1, 1),
+            ("test_seconds_bucket", 1.0, 2),
+            ("test_seconds_bucket", float("inf"), 3),
+            ("test_seconds_sum", None, 5.55),
+            ("test_seconds_count", None, 3),
+        ])
+        self.assertEqual(metrics.format_labels([("view", 'a"b')]), r'{view="a\"b"}')
+
+
+class AccessLogTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "access.jsonl"
+
+    def read(self, path=None):
+        return [json.loads(line) for line in (path or self.path).read_text().splitlines()]
+
+    def test_middleware_writes_selected_fields(self):
+        access_log = {"PATH": self.path, "FIELDS": ["path", "view", "status", "queries", "user_agent"]}
+        with override_settings(ACCESS_LOG=access_log):
+            self.client.get(reverse("requestdataapp:get-view"), HTTP_USER_AGENT='Mozilla/5.0')
+            self.client.get("/no-such-page/", HTTP_USER_AGENT='Mozilla/5.0')
+        get_writer(self.path).flush()
+
+        records = self.read()
+        self.assertEqual(records[0], {
+            "path": "/req/get/",
+            "view": "requestdataapp:get-view",
+            "status": 200,
+            "queries": 0,
+            "user_agent": "Mozilla/5.0",
+        })
+        self.assertEqual(records[1]["status"], 404)
+
+    def test_user_is_only_loaded_when_logged(self):
+        user = User.objects.create_user(username="logged", password="qwerty")
+        self.client.force_login(user)
+        url = reverse("requestdataapp:get-view")
+        with override_settings(ACCESS_LOG={"PATH": self.path, "FIELDS": ["path"]}):
+            with self.assertNumQueries(0):
+                self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0')
+        # The client keeps its middleware, so a new one reads the new settings
+        client = Client()
+        client.force_login(user)
+        with override_settings(ACCESS_LOG={"PATH": self.path, "FIELDS": ["user"]}):
+            client.get(url, HTTP_USER_AGENT='Mozilla/5.0')
+        get_writer(self.path).flush()
+        self.assertEqual(self.read(), [{"path": "/req/get/"}, {"user": user.pk}])
+
+    def test_writers_share_one_file(self):
+        # Two writers stand for two worker processes appending to one file
+        first = AccessLogWriter(self.path, max_bytes=200, backup_count=5)
+        second = AccessLogWriter(self.path, max_bytes=200, backup_count=5)
+        for index in range(20):
+            writer = first if index % 2 else second
+            writer.submit({"index": index, "text": "x" * 20})
+            writer.flush()
+
+        paths = [self.path] + [Path(f"{self.path}.{index}") for index in range(1, 6)]
+        records = [record for path in reversed(paths) if path.exists() for record in self.read(path)]
+        self.assertEqual([record["index"] for record in records], list(range(20)))
+        self.assertTrue(paths[1].exists())
+        for path in paths:
+            if path.exists():
+                self.assertLessEqual(path.stat().st_size, 200)
+
+    def test_sampling(self):
+        with override_settings(ACCESS_LOG={"PATH": self.path, "SAMPLE_RATE": 0}):
+            self.client.get(reverse("requestdataapp:get-view"), HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertFalse(self.path.exists())
+
+    def test_writer_rotates(self):
+        writer = AccessLogWriter(self.path, max_bytes=200, backup_count=2)
+        for index in range(20):
+            writer.submit({"index": index, "padding": "x" * 20})
+            writer.flush()
+
+        rotated = [Path(f"{self.path}.{index}") for index in (1, 2)]
+        self.assertTrue(all(path.exists() for path in rotated))
+        self.assertFalse(Path(f"{self.path}.3").exists())
+        self.assertLessEqual(self.path.stat().st_size, 200)
+        self.assertEqual(self.read()[-1]["index"], 19)
+
+
+class ContentAddressedStorageTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.storage = ContentAddressedStorage(location=self.tmp.name)
+
+    def blobs(self) -> list:
+        blobs_dir = Path(self.tmp.name) / ".blobs"
+        return [path for path in blobs_dir.rglob("*") if path.is_file()]
+
+    def test_duplicates_share_one_blob(self):
+        first = self.storage.save("a/photo.png", ContentFile(b"same bytes"))
+        second = self.storage.save("b/photo.png", ContentFile(b"same bytes"))
+        self.storage.save("c/other.png", ContentFile(b"other bytes"))
+
+        self.assertEqual((first, second), ("a/photo.png", "b/photo.png"))
+        self.assertEqual(len(self.blobs()), 2)
+        self.assertEqual(self.storage.refcount(first), 2)
+        self.assertTrue(os.path.samefile(self.storage.path(first), self.storage.path(second)))
+        with self.storage.open(second) as file:
+            self.assertEqual(file.read(), b"same bytes")
+
+    def test_same_name_and_content_keeps_name(self):
+        name = self.storage.save("photo.png", ContentFile(b"same bytes"))
+        self.assertEqual(self.storage.save("photo.png", ContentFile(b"same bytes")), name)
+        self.assertEqual(self.storage.refcount(name), 1)
+
+        renamed = self.storage.save("photo.png", ContentFile(b"new bytes"))
+        self.assertNotEqual(renamed, name)
+
+    def test_last_delete_removes_blob(self):
+        first = self.storage.save("a.txt", ContentFile(b"data"))
+        second = self.storage.save("b.txt", ContentFile(b"data"))
+        self.storage.delete(first)
+        self.assertEqual(len(self.blobs()), 1)
+        self.assertEqual(self.storage.refcount(second), 1)
+        self.storage.delete(second)
+        self.assertEqual(self.blobs(), [])
+        self.assertFalse(self.storage.exists(second))
+
+    def test_blob_deleted_while_saving_is_stored_again(self):
+        storage = self.storage
+
+        class RacingStorage(ContentAddressedStorage):
+            def install_blob(self, path, digest):
+                super().install_blob(path, digest)
+                if storage.exists("a.txt"):
+                    # Another process deletes the last name of the blob
+                    storage.delete("a.txt")
+
+        storage.save("a.txt", ContentFile(b"data"))
+        name = RacingStorage(location=self.tmp.name).save("b.txt", ContentFile(b"data"))
+        with storage.open(name) as file:
+            self.assertEqual(file.read(), b"data")
+        self.assertEqual(storage.refcount(name), 1)
+        self.assertEqual(len(self.blobs()), 1)
+
+    def test_delete_does_not_hash(self):
+        name = self.storage.save("a.txt", ContentFile(b"data"))
+
+        class NoHashStorage(ContentAddressedStorage):
+            def file_digest(self, path):
+                raise AssertionError("file was hashed")
+
+        NoHashStorage(location=self.tmp.name).delete(name)
+        self.assertEqual(self.blobs(), [])
+
+    def test_temporary_upload_is_linked_in_place(self):
+        class NoCopyStorage(ContentAddressedStorage):
+            def write_temp(self, content):
+                raise AssertionError("upload was copied")
+
+        with override_settings(FILE_UPLOAD_TEMP_DIR=self.tmp.name):
+            upload = TemporaryUploadedFile("notes.txt", "text/plain", 5, None)
+        self.addCleanup(upload.close)
+        upload.write(b"hello")
+        upload.flush()
+        inode = os.stat(upload.temporary_file_path()).st_ino
+
+        name = NoCopyStorage(location=self.tmp.name).save("notes.txt", upload)
+        self.assertEqual(os.stat(self.storage.path(name)).st_ino, inode)
+        self.assertEqual(self.storage.refcount(name), 1)
+        self.assertEqual(len(self.blobs()), 1)
+
+    def test_file_upload_view_uses_default_storage(self):
+        with override_settings(MEDIA_ROOT=self.tmp.name):
+            for _ in range(2):
+                self.client.post(
+                    reverse("requestdataapp:file-upload"),
+                    {"file": SimpleUploadedFile("notes.txt", b"hello")},
+                    HTTP_USER_AGENT='Mozilla/5.0',
+                )
+            self.assertEqual(default_storage.refcount("notes.txt"), 1)
+        self.assertEqual(len(self.blobs()), 1)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ChunkedUploadTestCase(TestCase):
+    def setUp(self):
+        self.data = os.urandom(3000)
+        self.user = User.objects.create_user(username="uploader", password="qwerty")
+        self.client.force_login(self.user)
+
+    def start(self, size=None):
+        response = self.client.post(
+            reverse("requestdataapp:chunked-upload-start"),
+            {"filename": "big.bin", "size": len(self.data) if size is None else size},
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response["Location"]
+
+    def patch(self, url, offset, chunk, checksum=None):
+        headers = {"HTTP_UPLOAD_OFFSET": str(offset), "HTTP_USER_AGENT": 'Mozilla/5.0'}
+        if checksum is not None:
+            headers["HTTP_UPLOAD_CHECKSUM"] = f"sha256 {checksum}"
+        return self.client.patch(url, chunk, content_type="application/offset+octet-stream", **headers)
+
+    def test_upload_resume_and_complete(self):
+        url = self.start()
+        first, second = self.data[:1000], self.data[1000:]
+
+        response = self.patch(url, 0, first, hashlib.sha256(first).hexdigest())
+        self.assertEqual(response.json()["offset"], 1000)
+
+        # Client lost the response and resends from a stale offset
+        self.assertEqual(self.patch(url, 0, first).status_code, 409)
+        response = self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response["Upload-Offset"], "1000")
+
+        response = self.patch(url, 1000, second, hashlib.sha256(second).hexdigest())
+        self.assertEqual(response.json()["status"], ChunkedUpload.Status.PROCESSING)
+        self.assertEqual(self.patch(url, 1000, second).status_code, 409)
+
+        # The file is hashed and stored by a job, not by the last request
+        job = run_job(claim_next_job())
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual(job.processed, len(self.data))
+
+        upload = ChunkedUpload.objects.get()
+        self.assertEqual(upload.status, ChunkedUpload.Status.COMPLETE)
+        with upload.file.open("rb") as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertFalse(os.path.exists(upload.partial_path))
+
+    def test_bad_checksum_is_rejected(self):
+        url = self.start()
+        chunk = self.data[:1000]
+        response = self.patch(url, 0, chunk, hashlib.sha256(b"other").hexdigest())
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(response.json()["offset"], 0)
+        upload = ChunkedUpload.objects.get()
+        self.assertEqual(os.path.getsize(upload.partial_path), 0)
+
+    def test_chunk_past_size_is_rejected(self):
+        url = self.start(size=10)
+        self.assertEqual(self.patch(url, 0, self.data[:11]).status_code, 413)
+
+    def test_size_is_limited_up_front(self):
+        self.addCleanup(setattr, chunked, "MAX_SIZE", chunked.MAX_SIZE)
+        chunked.MAX_SIZE = 2000
+        response = self.client.post(
+            reverse("requestdataapp:chunked-upload-start"),
+            {"filename": "big.bin", "size": len(self.data)},
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_anonymous_upload_is_rejected(self):
+        url = self.start()
+        self.client.logout()
+        response = self.client.post(
+            reverse("requestdataapp:chunked-upload-start"),
+            {"filename": "big.bin", "size": len(self.data)},
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.patch(url, 0, self.data[:1000]).status_code, 401)
+
+    def test_empty_file_is_complete_at_once(self):
+        self.start(size=0)
+        self.assertEqual(ChunkedUpload.objects.get().status, ChunkedUpload.Status.COMPLETE)
+
+    def test_chunk_is_rejected_while_another_is_written(self):
+        url = self.start()
+        ChunkedUpload.objects.update(status=ChunkedUpload.Status.WRITING)
+        response = self.patch(url, 0, self.data[:1000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(os.path.getsize(ChunkedUpload.objects.get().partial_path), 0)
+
+        # The claim of a request that died is taken over after a while
+        ChunkedUpload.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.patch(url, 0, self.data[:1000]).json()["offset"], 1000)
+        self.assertEqual(ChunkedUpload.objects.get().status, ChunkedUpload.Status.UPLOADING)
+
+    def test_upload_of_user_is_private(self):
+        url = self.start()
+        other = User.objects.create_user(username="other", password="qwerty")
+        self.client.force_login(other)
+        self.assertEqual(self.patch(url, 0, self.data[:1000]).status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0').status_code, 404)
+
+    def test_expire_abandoned_uploads(self):
+        self.start()
+        upload = ChunkedUpload.objects.get()
+        orphan = os.path.join(os.path.dirname(upload.partial_path), "orphan.part")
+        open(orphan, "wb").close()
+        os.utime(orphan, (0, 0))
+
+        call_command("expire_chunked_uploads", stdout=StringIO())
+        self.assertTrue(ChunkedUpload.objects.exists())
+
+        ChunkedUpload.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        call_command("expire_chunked_uploads", stdout=StringIO())
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertFalse(os.path.exists(upload.partial_path))
+        self.assertFalse(os.path.exists(orphan))
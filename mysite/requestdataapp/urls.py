@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import process_get_view,user_form, handle_file_upload
+from .views import process_get_view,user_form, handle_file_upload, chunked_upload_start, chunked_upload
 
 app_name = "requestdataapp"
 
@@ -7,4 +7,6 @@ urlpatterns = [
     path("get/", process_get_view, name="get-view"),
     path("bio/", user_form, name="user-form"),
     path("upload/", handle_file_upload, name="file-upload"),
+    path("upload/chunked/", chunked_upload_start, name="chunked-upload-start"),
+    path("upload/chunked/<uuid:pk>/", chunked_upload, name="chunked-upload"),
 ]
@@ -1,9 +1,17 @@
-from django.core.files.storage import FileSystemStorage
-from django.http import HttpResponse, HttpRequest
-from django.shortcuts import render
+import logging
 
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, HttpRequest, JsonResponse
+from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
 
-from .forms import UserBioForm, UploadFileForm
+
+from .chunked import ChunkError, append_chunk, parse_checksum, start_upload
+from .forms import UserBioForm, UploadFileForm, ChunkedUploadForm
+from .models import ChunkedUpload
+
+log = logging.getLogger(__name__)
 
 def process_get_view(request: HttpRequest) -> HttpResponse:
     a = request.GET.get("a", "")
@@ -28,9 +36,8 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
         if form.is_valid():
             # myfile = request.FILES["myfile"]
             myfile = form.cleaned_data['file']
-            fs = FileSystemStorage()
-            filename = fs.save(myfile.name, myfile)
-            print(f"Saved file {filename}")
+            filename = default_storage.save(myfile.name, myfile)
+            log.info("Saved file %s", filename)
     else:
         form = UploadFileForm()
 
@@ -39,3 +46,60 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
     }
     return render(request, "requestdataapp/file-upload.html", context=context)
 
+
+def chunked_upload_response(upload: ChunkedUpload, status: int = 200, **extra) -> JsonResponse:
+    data = {
+        "id": str(upload.pk),
+        "filename": upload.filename,
+        "size": upload.size,
+        "offset": upload.offset,
+        "status": upload.status,
+        "url": reverse("requestdataapp:chunked-upload", kwargs={"pk": upload.pk}),
+        **extra,
+    }
+    if upload.file:
+        data["file"] = upload.file.url
+    response = JsonResponse(data, status=status)
+    response["Upload-Offset"] = upload.offset
+    response["Upload-Length"] = upload.size
+    return response
+
+
+@require_http_methods(["POST"])
+def chunked_upload_start(request: HttpRequest) -> HttpResponse:
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    form = ChunkedUploadForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    try:
+        upload = start_upload(form.cleaned_data["filename"], form.cleaned_data["size"], request.user)
+    except ChunkError as error:
+        return JsonResponse({"error": str(error)}, status=error.status)
+    response = chunked_upload_response(upload, status=201)
+    response["Location"] = reverse("requestdataapp:chunked-upload", kwargs={"pk": upload.pk})
+    return response
+
+
+@require_http_methods(["GET", "HEAD", "PATCH"])
+def chunked_upload(request: HttpRequest, pk) -> HttpResponse:
+    """
+    GET/HEAD report the offset to resume from, PATCH appends a chunk
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    upload = get_object_or_404(ChunkedUpload, pk=pk, user=request.user)
+    if request.method != "PATCH":
+        return chunked_upload_response(upload)
+
+    try:
+        offset = int(request.headers["Upload-Offset"])
+        length = int(request.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return chunked_upload_response(upload, status=400, error="Upload-Offset and Content-Length are required")
+    try:
+        checksum = parse_checksum(request.headers.get("Upload-Checksum", ""))
+        append_chunk(upload, request, offset, length, checksum)
+    except ChunkError as error:
+        return chunked_upload_response(upload, status=error.status, error=str(error))
+    return chunked_upload_response(upload)
@@ -1,12 +1,18 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from django.db.models import QuerySet
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
-from django.urls import path
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils.http import urlencode
 
-from .common import save_csv_products, save_csv_orders
+from jobsapp.tasks import enqueue
+from .tasks import ARCHIVE_BATCH_SIZE
 from .models import Product, Order, ProductImages
 from .admin_mixin import ExportAsCSVMixin
+from .search import search_products
 from .forms import CSVImportForm
 
 
@@ -17,13 +23,62 @@ class ProductInLines(admin.StackedInline):
     model = ProductImages
 
 
+def message_job_queued(modeladmin: admin.ModelAdmin, request: HttpRequest, job, description: str):
+    job_url = reverse("admin:jobsapp_job_change", args=[job.pk])
+    modeladmin.message_user(
+        request,
+        format_html('{} queued as <a href="{}">job #{}</a>', description, job_url, job.pk),
+    )
+
+
+def message_jobs_queued(modeladmin: admin.ModelAdmin, request: HttpRequest, jobs: list, description: str):
+    """
+    One message for a batch of jobs, linking to the job changelist filtered to them
+    """
+    if len(jobs) == 1:
+        return message_job_queued(modeladmin, request, jobs[0], description)
+    query = urlencode({
+        "task": jobs[0].task,
+        "pk__gte": jobs[0].pk,
+        "pk__lte": jobs[-1].pk,
+    })
+    jobs_url = f"{reverse('admin:jobsapp_job_changelist')}?{query}"
+    modeladmin.message_user(
+        request,
+        format_html('{} queued in <a href="{}">{} jobs</a>', description, jobs_url, len(jobs)),
+    )
+
+
+def enqueue_archived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet, archived: bool):
+    # One job per batch, so job kwargs stay small however many products are selected
+    pks = queryset.order_by("pk").values_list("pk", flat=True)
+    jobs = []
+    count = 0
+    last_pk = 0
+    while True:
+        batch = list(pks.filter(pk__gt=last_pk)[:ARCHIVE_BATCH_SIZE])
+        if not batch:
+            break
+        jobs.append(enqueue(
+            "shopapp.set_products_archived",
+            user=request.user,
+            total=len(batch),
+            pks=batch,
+            archived=archived,
+        ))
+        count += len(batch)
+        last_pk = batch[-1]
+    if jobs:
+        message_jobs_queued(modeladmin, request, jobs, f"Archive update of {count} products")
+
+
 @admin.action(description="Archive products")
 def mark_archived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset:QuerySet):
-    queryset.update(archived=True)
+    enqueue_archived(modeladmin, request, queryset, archived=True)
 
 @admin.action(description="Unarchive products")
 def mark_unarchived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset:QuerySet):
-    queryset.update(archived=False)
+    enqueue_archived(modeladmin, request, queryset, archived=False)
 
 
 @admin.register(Product)
@@ -61,6 +116,16 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
         }),
     ]
 
+    def get_search_results(self, request, queryset, search_term):
+        if search_term:
+            results = search_products(queryset, search_term)
+            if results is not None:
+                # Ranked by bm25, unless the changelist is sorted by a column
+                if ORDER_VAR in request.GET:
+                    results = results.order_by(*queryset.query.order_by)
+                return results, False
+        return super().get_search_results(request, queryset, search_term)
+
     def description_short(self, obj: Product) -> str:
         if len(obj.description) < 48:
             return obj.description
@@ -81,11 +146,13 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
             }
             return render(request, "admin/csv_form.html", context=context, status=400)
 
-        save_csv_products(
-            form.files["csv_file"].file,
-            encoding=request.encoding,
+        job = enqueue(
+            "shopapp.import_products_csv",
+            file=form.files["csv_file"],
+            user=request.user,
+            encoding=request.encoding or settings.DEFAULT_CHARSET,
         )
-        self.message_user(request, "Data form CSV was imported")
+        message_job_queued(self, request, job, "CSV import")
         return redirect("..")
 
     def get_urls(self):
@@ -109,12 +176,15 @@ class ProductInLine(admin.StackedInline):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(admin.ModelAdmin, ExportAsCSVMixin):
     change_list_template = "shopapp/orders_changelist.html"
+    actions = [
+        "exropt_csv",
+    ]
     inlines = [
         ProductInLine,
     ]
-    list_display = "delivery_address", "promocode", "created_at", "user_verbose"
+    list_display = "delivery_address", "promocode", "created_at", "user_verbose", "products_count", "total_price"
 
 
     def get_queryset(self, request):
@@ -140,11 +210,13 @@ class OrderAdmin(admin.ModelAdmin):
             }
             return render(request, "admin/csv_form.html", context=context, status=400)
 
-        save_csv_orders(
-            form.files["csv_file"].file,
-            encoding=request.encoding,
+        job = enqueue(
+            "shopapp.import_orders_csv",
+            file=form.files["csv_file"],
+            user=request.user,
+            encoding=request.encoding or settings.DEFAULT_CHARSET,
         )
-        self.message_user(request, "Data form CSV was imported")
+        message_job_queued(self, request, job, "CSV import")
         return redirect("..")
 
     def get_urls(self):
@@ -1,22 +1,23 @@
-import csv
 from django.db.models import QuerySet
 from django.db.models.options import Options
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, StreamingHttpResponse
+
+from .common import iter_csv_rows
 
 
 class ExportAsCSVMixin:
     def exropt_csv(self, request: HttpRequest, queryset: QuerySet):
         meta: Options = self.model._meta
-        field_names = [field.name for field in meta.fields]
-
-        response = HttpResponse(content_type="text/csv")
-        response["Contrnt-Disposition"] = f"attachment; filename = {meta}-export.csv"
-        csv_writer = csv.writer(response)
-        csv_writer.writerow(field_names)
-
-        for obj in queryset:
-            csv_writer.writerow(getattr(obj,field) for field in field_names)
+        field_names = [field.name for field in meta.concrete_fields]
+        # attname reads foreign keys as raw ids, without joins
+        columns = [field.attname for field in meta.concrete_fields]
+        queryset = queryset.select_related(None).prefetch_related(None)
 
+        response = StreamingHttpResponse(
+            iter_csv_rows(queryset, columns, header=field_names),
+            content_type="text/csv",
+        )
+        response["Content-Disposition"] = f"attachment; filename={meta.model_name}-export.csv"
         return response
 
-    exropt_csv.short_description = "Export as CSV"
\ No newline at end of file
+    exropt_csv.short_description = "Export as CSV"
@@ -1,50 +1,291 @@
-from csv import DictReader
+from csv import DictReader, writer
+from dataclasses import dataclass, field
 from io import TextIOWrapper
+from timeit import default_timer
 
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 
-from shopapp.models import Product, Order
+from mysite.cache_tags import bump_tags
+from mysite.sitemap_files import schedule_rebuild
+from shopapp.models import Product, Order, update_order_totals, PRODUCTS_TAG, user_orders_tag
 
 
+EXPORT_CHUNK_SIZE = 2000
+KEYSET_DEFAULT_LIMIT = 1000
+KEYSET_MAX_LIMIT = 10000
+IMPORT_BATCH_SIZE = 500
+PRODUCT_IMPORT_FIELDS = "name", "description", "price", "discount", "archived"
+ORDER_IMPORT_FIELDS = "delivery_address", "promocode"
+
+
+class Echo:
+    """
+    File-like object for csv.writer: returns the line instead of buffering it
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE, header=None):
+    """
+    Yield CSV lines for queryset, reading it in chunks of plain tuples
+    """
+    csv_writer = writer(Echo())
+    yield csv_writer.writerow(header or fields)
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield csv_writer.writerow(row)
+
+
+def iter_ndjson_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one JSON document per line for queryset, read in chunks of dicts
+    """
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    rows = queryset.values(*fields).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield encoder.encode(row) + "\n"
+
+
+def parse_keyset_params(params):
+    """
+    Read ``after_pk`` and ``limit`` from query params.
+
+    Returns None when keyset paging was not requested,
+    raises ValueError on bad values.
+    """
+    if "after_pk" not in params and "limit" not in params:
+        return None
+    after_pk = int(params.get("after_pk") or 0)
+    limit = int(params.get("limit") or KEYSET_DEFAULT_LIMIT)
+    if after_pk < 0 or limit < 1:
+        raise ValueError("after_pk and limit must be positive")
+    return after_pk, min(limit, KEYSET_MAX_LIMIT)
+
+
+def keyset_page(queryset, after_pk, limit):
+    return queryset.filter(pk__gt=after_pk).order_by("pk")[:limit]
+
+
+@dataclass
+class ChunkStats:
+    first_line: int
+    last_line: int
+    created: int = 0
+    rejected: list = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        rows = self.created + len(self.rejected)
+        return rows / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "first_line": self.first_line,
+            "last_line": self.last_line,
+            "created": self.created,
+            "rejected": [
+                {"line": line, "error": error}
+                for line, error in self.rejected
+            ],
+            "rows_per_sec": round(self.rows_per_sec, 1),
+        }
 
-def save_csv_products(file, encoding):
-    csv_file = TextIOWrapper(
-        file,
-        encoding=encoding,
-    )
-    reader = DictReader(csv_file)
 
-    products = [
-        Product(**row)
-        for row in reader
-    ]
-    Product.objects.bulk_create(products)
-    return products
+@dataclass
+class ImportStats:
+    chunks: list = field(default_factory=list)
 
+    @property
+    def created(self) -> int:
+        return sum(chunk.created for chunk in self.chunks)
 
-def save_csv_orders(file, encoding):
+    @property
+    def rejected(self) -> list:
+        return [line for chunk in self.chunks for line in chunk.rejected]
+
+    @property
+    def rows_per_sec(self) -> float:
+        rows = self.created + len(self.rejected)
+        seconds = sum(chunk.seconds for chunk in self.chunks)
+        return rows / seconds if seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "rejected": len(self.rejected),
+            "rows_per_sec": round(self.rows_per_sec, 1),
+            "chunks": [chunk.as_dict() for chunk in self.chunks],
+        }
+
+
+def iter_csv_chunks(file, encoding, batch_size=IMPORT_BATCH_SIZE, after_line=0):
+    """
+    Lazily read CSV file and yield lists of ``(line_number, row)``,
+    skipping rows up to after_line
+    """
     csv_file = TextIOWrapper(
         file,
         encoding=encoding,
     )
     reader = DictReader(csv_file)
 
-    orders = []
+    chunk = []
     for row in reader:
-        user_id = row.get("user")
-        user = User.objects.get(pk=user_id)
-        order = Order(
-            delivery_address=row.get('delivery_address'),
-            promocode=row.get('promocode'),
-            user=user,
+        if reader.line_num <= after_line:
+            continue
+        chunk.append((reader.line_num, row))
+        if len(chunk) >= batch_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validation_message(error: ValidationError) -> str:
+    if hasattr(error, "error_dict"):
+        return "; ".join(
+            f"{name}: {' '.join(messages)}"
+            for name, messages in error.message_dict.items()
         )
-        orders.append(order)
+    return " ".join(error.messages)
+
+
+def clean_row(model, field_names, row: dict) -> dict:
+    """
+    Coerce and validate CSV values through model fields, raises ValidationError
+    """
+    values = {}
+    errors = {}
+    for name in field_names:
+        model_field = model._meta.get_field(name)
+        raw = row.get(name)
+        if raw is None or (raw == "" and model_field.has_default()):
+            values[name] = model_field.get_default()
+            continue
+        raw = raw.strip()
+        if isinstance(model_field, models.BooleanField):
+            raw = raw.capitalize()
+        try:
+            values[name] = model_field.clean(raw, None)
+        except ValidationError as error:
+            errors[name] = error.messages
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+def product_from_row(row: dict) -> Product:
+    return Product(**clean_row(Product, PRODUCT_IMPORT_FIELDS, row))
+
 
-    Order.objects.bulk_create(orders)
+def save_csv_products(file, encoding, batch_size=IMPORT_BATCH_SIZE, on_chunk=None, after_line=0):
+    """
+    Import products from CSV chunk by chunk.
+
+    Every chunk is validated row by row and saved in its own transaction,
+    so a bad row is reported with its line number instead of failing the
+    whole file. ``on_chunk`` is called with ChunkStats inside that
+    transaction, so a checkpoint it writes commits together with the rows;
+    pass the checkpoint back as after_line to resume an interrupted import.
+    """
+    stats = ImportStats()
+    for chunk in iter_csv_chunks(file, encoding, batch_size, after_line):
+        started = default_timer()
+        chunk_stats = ChunkStats(first_line=chunk[0][0], last_line=chunk[-1][0])
+        products = []
+        for line, row in chunk:
+            try:
+                products.append(product_from_row(row))
+            except ValidationError as error:
+                chunk_stats.rejected.append((line, validation_message(error)))
+
+        chunk_stats.created = len(products)
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            if on_chunk is not None:
+                on_chunk(chunk_stats)
+        bump_tags(PRODUCTS_TAG)
+        if products:
+            schedule_rebuild("shopapp")
+        chunk_stats.seconds = default_timer() - started
+        stats.chunks.append(chunk_stats)
+    return stats
+
+
+def parse_order_row(row: dict):
+    """
+    Return ``(order, user_id, product_ids)`` for one CSV row, raises ValidationError
+    """
+    order = Order(**clean_row(Order, ORDER_IMPORT_FIELDS, row))
+    try:
+        user_id = int(row.get("user") or "")
+        product_ids = {
+            int(product_id)
+            for product_id in (row.get("products") or "").split(",")
+            if product_id.strip()
+        }
+    except ValueError:
+        raise ValidationError("user and products must be ids")
+    return order, user_id, product_ids
+
+
+def save_csv_orders(file, encoding, batch_size=IMPORT_BATCH_SIZE, on_chunk=None, after_line=0):
+    """
+    Import orders from CSV with a fixed number of queries per chunk.
+
+    Users and products referenced by the chunk are resolved with one
+    ``in_bulk`` each, then orders and ``Order.products.through`` rows are
+    bulk-created and their totals filled in one transaction. ``on_chunk``
+    and after_line work as in save_csv_products.
+    """
+    through = Order.products.through
+    stats = ImportStats()
+    for chunk in iter_csv_chunks(file, encoding, batch_size, after_line):
+        started = default_timer()
+        chunk_stats = ChunkStats(first_line=chunk[0][0], last_line=chunk[-1][0])
+        parsed = []
+        for line, row in chunk:
+            try:
+                parsed.append((line, *parse_order_row(row)))
+            except ValidationError as error:
+                chunk_stats.rejected.append((line, validation_message(error)))
+
+        users = User.objects.only("pk").in_bulk(
+            {user_id for _, _, user_id, _ in parsed}
+        )
+        products = Product.objects.only("pk").in_bulk(
+            {pk for _, _, _, product_ids in parsed for pk in product_ids}
+        )
 
-    for order in orders:
-        product_id = row.get('products').split(',')
-        products = Product.objects.filter(id__in=product_id)
-        order.products.set(products)
+        orders = []
+        for line, order, user_id, product_ids in parsed:
+            missing = sorted(pk for pk in product_ids if pk not in products)
+            if user_id not in users:
+                chunk_stats.rejected.append((line, f"user: unknown id {user_id}"))
+            elif missing:
+                chunk_stats.rejected.append((line, f"products: unknown ids {missing}"))
+            else:
+                order.user_id = user_id
+                orders.append((order, product_ids))
 
-    return orders
+        with transaction.atomic():
+            Order.objects.bulk_create([order for order, _ in orders])
+            through.objects.bulk_create([
+                through(order_id=order.pk, product_id=product_id)
+                for order, product_ids in orders
+                for product_id in product_ids
+            ])
+            update_order_totals(Order.objects.filter(pk__in=[order.pk for order, _ in orders]))
+            chunk_stats.created = len(orders)
+            if on_chunk is not None:
+                on_chunk(chunk_stats)
+        bump_tags(*{user_orders_tag(order.user_id) for order, _ in orders})
+        chunk_stats.seconds = default_timer() - started
+        stats.chunks.append(chunk_stats)
+    return stats
@@ -0,0 +1,232 @@
+"""
+Resized, re-encoded variants of product images.
+
+Variants are stored in a directory of their own per original:
+``preview/desk.png`` gets ``preview/variants/desk.png/200.webp``,
+``preview/variants/desk.png/200.jpg``, ``preview/variants/desk.png/600.webp``
+and so on, so they never take the name of an upload or of the variants
+of another original. The names they were saved under are recorded on
+the product (``preview_variants``) or product image (``variants``) as
+``{format: {width: name}}``, so pages and the API link them without
+touching storage and fall back to the original until they are made.
+Only recorded names are ever deleted.
+"""
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from PIL import Image, ImageOps
+
+from jobsapp.tasks import enqueue
+from .models import Product, ProductImages
+
+VARIANT_WIDTHS = (200, 600)
+# format name: (Pillow format, file extension, content type)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "webp", "image/webp"),
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+}
+VARIANT_QUALITY = 80
+VARIANTS_DIR = "variants"
+INGEST_WORKERS = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def variants_dir(name: str) -> str:
+    head, filename = posixpath.split(name)
+    return posixpath.join(head, VARIANTS_DIR, filename)
+
+
+def variant_name(name: str, width: int, fmt: str) -> str:
+    return posixpath.join(variants_dir(name), f"{width}.{VARIANT_FORMATS[fmt][1]}")
+
+
+def variant_names(variants) -> list:
+    """
+    Stored names of recorded ``{format: {width: name}}`` variants that are
+    in a variants directory; names recorded next to the originals by
+    older versions may be uploads and are left alone
+    """
+    return [
+        name
+        for by_width in (variants or {}).values()
+        for name in by_width.values()
+        if posixpath.basename(posixpath.dirname(posixpath.dirname(name))) == VARIANTS_DIR
+    ]
+
+
+def delete_variants(variants, storage=None):
+    storage = storage or default_storage
+    for name in variant_names(variants):
+        storage.delete(name)
+
+
+def encode(image: Image.Image, fmt: str) -> bytes:
+    pillow_format = VARIANT_FORMATS[fmt][0]
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    buffer = BytesIO()
+    image.save(buffer, format=pillow_format, quality=VARIANT_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def make_variants(name: str, storage=None, recorded=None) -> dict:
+    """
+    Write every width/format variant of original ``name``, return their
+    stored names as ``{format: {width: name}}`` (widths as strings, like JSON).
+    The ``recorded`` variants made before are deleted first.
+    """
+    storage = storage or default_storage
+    delete_variants(recorded, storage)
+    with storage.open(name, "rb") as original:
+        image = Image.open(original)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+
+    written = {}
+    for width in VARIANT_WIDTHS:
+        resized = image.copy()
+        # Never upscale: small originals get re-encoded only
+        resized.thumbnail((width, image.height), Image.LANCZOS)
+        for fmt in VARIANT_FORMATS:
+            variant = variant_name(name, width, fmt)
+            # Storage picks another name if an unrecorded variant is in the way
+            written.setdefault(fmt, {})[str(width)] = storage.save(variant, ContentFile(encode(resized, fmt)))
+    return written
+
+
+def variant_pool(workers=None) -> ProcessPoolExecutor:
+    """
+    Process pool shared by every job of this process, started on first
+    use with ``workers`` processes
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def reset_variant_pool(pool: ProcessPoolExecutor):
+    """
+    Drop a broken pool so the next call starts a new one
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def make_variants_in_pool(names, workers=None) -> dict:
+    """
+    Make variants for many originals in the shared process pool and
+    record them on the products and images using each original.
+
+    Returns ``{name: error}`` with ``None`` for successful originals.
+    """
+    names = list(names)
+    recorded = recorded_variants(names)
+    made, results = {}, {}
+    if len(names) <= 1:
+        for name in names:
+            try:
+                made[name] = make_variants(name, recorded=recorded.get(name))
+                results[name] = None
+            except Exception as exc:
+                results[name] = exc
+    else:
+        executor = variant_pool(workers)
+        # Workers outlive settings changes, so they get the storage to use
+        storage = storages["default"]
+        try:
+            futures = {executor.submit(make_variants, name, storage, recorded.get(name)): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                results[name] = future.exception()
+                if results[name] is None:
+                    made[name] = future.result()
+        except BrokenProcessPool as exc:
+            reset_variant_pool(executor)
+            for name in names:
+                results.setdefault(name, exc)
+    save_variants(made)
+    return results
+
+
+def recorded_variants(names) -> dict:
+    """
+    ``{original name: variants}`` recorded on the rows using the originals
+    """
+    recorded = dict(Product.objects.filter(preview__in=names).values_list("preview", "preview_variants"))
+    recorded.update(ProductImages.objects.filter(image__in=names).values_list("image", "variants"))
+    return recorded
+
+
+def save_variants(made: dict):
+    """
+    Record ``{original name: variants}`` on the rows using the originals
+    """
+    for name, variants in made.items():
+        Product.objects.filter(preview=name).update(preview_variants=variants)
+        ProductImages.objects.filter(image=name).update(variants=variants)
+
+
+def variant_urls(file, variants, storage=None) -> dict:
+    """
+    ``{"webp": {200: url, 600: url}, "jpeg": {...}}`` for the recorded variants of a FieldFile
+    """
+    if not file or not variants:
+        return {}
+    storage = storage or file.storage
+    return {
+        fmt: {int(width): storage.url(name) for width, name in by_width.items()}
+        for fmt, by_width in variants.items()
+        if fmt in VARIANT_FORMATS
+    }
+
+
+@dataclass
+class ImageUpload:
+    name: str
+    stored: str = None
+    error: str = None
+
+
+def store_image(file, name: str, storage) -> ImageUpload:
+    """
+    Check that file is an image Pillow can read and save it under name
+    """
+    try:
+        Image.open(file).verify()
+    except Exception:
+        return ImageUpload(file.name, error="Upload a valid image.")
+    file.seek(0)
+    return ImageUpload(file.name, stored=storage.save(name, file))
+
+
+def ingest_product_images(product, files, workers=INGEST_WORKERS) -> list:
+    """
+    Validate and store uploaded files for product in a thread pool, then
+    insert all ``ProductImages`` rows at once. Returns one ImageUpload per file.
+    """
+    field = ProductImages._meta.get_field("image")
+    names = [field.generate_filename(ProductImages(product=product), file.name) for file in files]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(store_image, files, names, [field.storage] * len(files)))
+
+    stored = [result.stored for result in results if result.stored]
+    if stored:
+        # bulk_create sends no post_save, so queue the variants here
+        ProductImages.objects.bulk_create(ProductImages(product=product, image=name) for name in stored)
+        enqueue("shopapp.make_image_variants", names=stored, product_ids=[product.pk])
+    return results
@@ -1,4 +1,4 @@
-from django.db.models import Avg, Sum, Max, Min, Count
+from django.db.models import Avg, Max, Min
 from django.core.management import BaseCommand
 from shopapp.models import Product, Order
 
@@ -18,16 +18,13 @@ class Command(BaseCommand):
         # )
         # print(result)
 
-        orders = Order.objects.annotate(
-            total=Sum("products__price", default=0),
-            products_count=Count("products"),
-        )
+        orders = Order.objects.only("id", "products_count", "total_price")
 
         for order in orders:
             print(
                 f"Order #{order.id} "
                 f"with {order.products_count} "
-                f"products worth {order.total}"
+                f"products worth {order.total_price}"
             )
 
         self.stdout.write(self.style.SUCCESS(f"DONE"))
\ No newline at end of file
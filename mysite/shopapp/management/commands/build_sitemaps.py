@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from mysite.sitemap_files import build_sitemaps
+
+
+class Command(BaseCommand):
+    """
+    Renders gzipped sitemap sections and index to SITEMAP_ROOT
+    """
+    help = "Build pre-rendered sitemap files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("sections", nargs="*", help="Sections to rebuild (default: all)")
+        parser.add_argument("--base-url", default=None)
+
+    def handle(self, *args, **options):
+        self.stdout.write("Build sitemaps")
+        result = build_sitemaps(options["sections"] or None, base_url=options["base_url"])
+        for section, stats in result.items():
+            self.stdout.write(f"{section}: {stats['pages']} pages, {stats['written']} written")
+        self.stdout.write(self.style.SUCCESS("DONE"))
@@ -0,0 +1,54 @@
+from django.core.management import BaseCommand
+from django.db import connections
+from django.db.models.functions import Now
+
+from mysite.cache_tags import bump_tags
+from shopapp.images import make_variants_in_pool
+from shopapp.models import Product, ProductImages, PRODUCTS_TAG
+
+
+class Command(BaseCommand):
+    """
+    Backfills resized variants of product previews and images in a process pool
+    """
+    help = "Make resized WebP/JPEG variants for existing product images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Remake variants that already exist",
+        )
+
+    def originals(self):
+        previews = Product.objects.exclude(preview="").exclude(preview__isnull=True)
+        yield from previews.values_list("preview", "pk", "preview_variants").iterator()
+        yield from ProductImages.objects.values_list("image", "product_id", "variants").iterator()
+
+    def handle(self, *args, **options):
+        self.stdout.write("Make image variants")
+
+        todo = {}
+        for name, product_id, variants in self.originals():
+            if options["force"] or not variants:
+                todo[name] = product_id
+        names = list(todo)
+        connections.close_all()
+
+        made = failed = 0
+        for start in range(0, len(names), options["batch_size"]):
+            batch = names[start:start + options["batch_size"]]
+            results = make_variants_in_pool(batch, workers=options["workers"])
+            for name, error in results.items():
+                if error is None:
+                    made += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+            Product.objects.filter(pk__in={todo[name] for name in batch}).update(updated_at=Now())
+            self.stdout.write(f"Made variants for {made} images, {failed} failed")
+
+        bump_tags(PRODUCTS_TAG)
+        self.stdout.write(self.style.SUCCESS("DONE"))
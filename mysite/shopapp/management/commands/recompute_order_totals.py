@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+from shopapp.models import Order, update_order_totals
+
+
+class Command(BaseCommand):
+    """
+    Repairs stored order totals in batches
+    """
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.stdout.write("Recompute order totals")
+
+        last_pk = 0
+        updated = 0
+        while True:
+            pks = list(
+                Order.objects
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:options["batch_size"]]
+            )
+            if not pks:
+                break
+            updated += update_order_totals(Order.objects.filter(pk__in=pks))
+            last_pk = pks[-1]
+            self.stdout.write(f"Updated {updated} orders")
+
+        self.stdout.write(self.style.SUCCESS("DONE"))
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+# The index as it was created here; shopapp.search.PRODUCT_INDEX reinstalls
+# missing triggers after every migrate
+FTS_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shopapp_product_fts USING fts5("
+    "name, description, content='shopapp_product', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS shopapp_product_fts_ai AFTER INSERT ON shopapp_product "
+    "BEGIN INSERT INTO shopapp_product_fts(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS shopapp_product_fts_ad AFTER DELETE ON shopapp_product "
+    "BEGIN INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS shopapp_product_fts_au AFTER UPDATE OF name, description ON shopapp_product "
+    "BEGIN INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO shopapp_product_fts(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+    "INSERT INTO shopapp_product_fts(shopapp_product_fts) VALUES ('rebuild')",
+]
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ai",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ad",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_au",
+    "DROP TABLE IF EXISTS shopapp_product_fts",
+]
+
+
+def run_sqlite(statements):
+    # FTS5 is SQLite only, other backends search with icontains
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0013_order_total_price_products_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='description',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(run_sqlite(FTS_SQL), run_sqlite(DROP_SQL)),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0016_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='products_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:50
+
+import django.db.models.deletion
+import mysite.fts
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0018_keyset_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchRow',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_row', serialize=False, to='shopapp.product')),
+                ('document', mysite.fts.DocumentField(db_column='shopapp_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'shopapp_product_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,165 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date, urlencode
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from mysite import cache_tags
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified for list and retrieve.
+
+    Validators come from one aggregate over ``last_modified_field``
+    (max timestamp and row count of the filtered queryset), so a client
+    with current data gets 304 without serializing anything. Lists only
+    send the ETag: deleting a row lowers the count but not the max
+    timestamp, so Last-Modified would miss it.
+    """
+    last_modified_field = "updated_at"
+
+    def make_etag(self, request, *parts) -> str:
+        value = "|".join(str(part) for part in (request.get_full_path(), request.accepted_renderer.format, *parts))
+        return quote_etag(hashlib.md5(value.encode()).hexdigest())
+
+    def get_list_validators(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        stats = queryset.aggregate(
+            last_modified=Max(self.last_modified_field),
+            count=Count("pk"),
+        )
+        return self.make_etag(request, stats["last_modified"], stats["count"]), None
+
+    def get_retrieve_validators(self, request):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        last_modified = (
+            self.get_queryset()
+            .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            .values_list(self.last_modified_field, flat=True)
+            .first()
+        )
+        if last_modified is None:
+            return None, None
+        return self.make_etag(request, last_modified), last_modified
+
+    def conditional_response(self, request, validators, get_response):
+        etag, last_modified = validators
+        if etag is None:
+            return get_response()
+        # Whole seconds, like If-Modified-Since (and Django's condition())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            return not_modified
+        response = get_response()
+        if response.status_code == 200:
+            response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            self.get_list_validators(request),
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            self.get_retrieve_validators(request),
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+
+class CachedListMixin:
+    """
+    Cache serialized list responses under ``list_cache_tags``.
+
+    The key is built from the query parameters the view reads (filters,
+    search, ordering, pagination, fieldsets), so unknown ones such as
+    ``?_=<timestamp>`` do not make new cache entries.
+    """
+    list_cache_name = None
+    list_cache_tags = ()
+    # Attributes of filter backends, paginators and the view naming query parameters
+    list_cache_param_attrs = (
+        "search_param",
+        "ordering_param",
+        "page_query_param",
+        "page_size_query_param",
+        "cursor_query_param",
+        "pagination_query_param",
+        "fields_query_param",
+        "omit_query_param",
+    )
+
+    def get_list_cache_params(self) -> set:
+        params = {api_settings.URL_FORMAT_OVERRIDE}
+        sources = [self, self.paginator, getattr(self, "cursor_pagination_class", None)]
+        for backend_class in self.filter_backends:
+            backend = backend_class()
+            sources.append(backend)
+            if hasattr(backend, "get_filterset_class"):
+                filterset_class = backend.get_filterset_class(self, self.get_queryset())
+                if filterset_class is not None:
+                    params.update(filterset_class.base_filters)
+        for source in sources:
+            for attr in self.list_cache_param_attrs:
+                value = getattr(source, attr, None)
+                if value:
+                    params.add(value)
+        return params
+
+    def get_list_cache_url(self, request) -> str:
+        params = self.get_list_cache_params()
+        query = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            if name in params
+            for value in values
+        )
+        return f"{request.scheme}://{request.get_host()}{request.path}?{urlencode(query)}"
+
+    def list(self, request, *args, **kwargs):
+        data = cache_tags.get_or_set(
+            cache_tags.hashed_name(self.list_cache_name, self.get_list_cache_url(request)),
+            self.list_cache_tags,
+            lambda: super(CachedListMixin, self).list(request, *args, **kwargs).data,
+        )
+        return Response(data)
+
+
+class SparseFieldsetViewMixin:
+    """
+    ``?fields=name,price`` / ``?omit=description`` for read requests.
+
+    The serializer drops the other fields; combined with
+    :class:`mysite.query_planner.QueryPlannerMixin` the queryset then
+    loads only the matching columns.
+    """
+    fields_query_param = "fields"
+    omit_query_param = "omit"
+
+    def get_sparse_fieldset(self):
+        request = getattr(self, "request", None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None, None
+
+        def parse(value):
+            if not value:
+                return None
+            return {name.strip() for name in value.split(",") if name.strip()}
+
+        params = request.query_params
+        return parse(params.get(self.fields_query_param)), parse(params.get(self.omit_query_param))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fields"], context["omit"] = self.get_sparse_fieldset()
+        return context
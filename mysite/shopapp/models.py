@@ -1,7 +1,21 @@
+from decimal import Decimal
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
 from django.urls import reverse
 
+from mysite.fts import DocumentField
+
+
+# Cache tags, see mysite.cache_tags
+PRODUCTS_TAG = "product:*"
+
+
+def user_orders_tag(user_id) -> str:
+    return f"user:{user_id}:orders"
+
 
 def product_preview_dir_path(instance: "Product", filename: str):
     return "products/product_{pk}/preview/{filename}".format(
@@ -21,15 +35,23 @@ class Product(models.Model):
         ordering = ["name"]
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
+        # Keyset pages of the API orderings, see shopapp.pagination
+        indexes = [
+            models.Index(fields=["price", "id"]),
+            models.Index(fields=["discount", "id"]),
+        ]
 
     name = models.CharField(max_length=100, db_index=True)
-    description = models.TextField(null=False, blank=True, db_index=True)
+    description = models.TextField(null=False, blank=True)
     price = models.DecimalField(default=0, max_digits=8, decimal_places=2)
     discount = models.SmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     archived = models.BooleanField(default=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="products", null=True)
     preview = models.ImageField(null=True, blank=True, upload_to=product_preview_dir_path)
+    # {format: {width: name}} of resized copies, see shopapp.images
+    preview_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     # @property
     # def description_short(self) -> str:
@@ -37,6 +59,14 @@ class Product(models.Model):
     #         return self.description
     #     return self.description[:48] + "..."
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to find price changes, see shopapp.signals
+        if "price" in instance.__dict__:
+            instance._loaded_price = instance.price
+        return instance
+
     def __str__(self):
         return f"Product(pk={self.pk}, name={self.name!r})"
 
@@ -44,6 +74,22 @@ class Product(models.Model):
         return reverse("shopapp:product_details", kwargs={"pk": self.pk})
 
 
+class ProductSearchRow(models.Model):
+    """
+    Row of the product full-text index, joined to rank searches, see shopapp.search
+    """
+
+    class Meta:
+        managed = False
+        db_table = "shopapp_product_fts"
+
+    product = models.OneToOneField(
+        Product, on_delete=models.DO_NOTHING, primary_key=True, db_column="rowid", related_name="search_row",
+    )
+    document = DocumentField(db_column="shopapp_product_fts")
+    rank = models.FloatField()
+
+
 def product_images_dir_path(instance: "ProductImages", filename: str):
     return "products/product_{pk}/preview/{filename}".format(
         pk=instance.product.pk,
@@ -54,6 +100,8 @@ def product_images_dir_path(instance: "ProductImages", filename: str):
 class ProductImages(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="images")
     image = models.ImageField(upload_to=product_images_dir_path)
+    # {format: {width: name}} of resized copies, see shopapp.images
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(max_length=200, null=False, blank=True)
 
 
@@ -61,10 +109,67 @@ class Order(models.Model):
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        # Keyset pages of the API orderings, see shopapp.pagination
+        indexes = [
+            models.Index(fields=["total_price", "id"]),
+            models.Index(fields=["products_count", "id"]),
+        ]
 
     delivery_address = models.TextField(null=True, blank=True)
     promocode = models.CharField(max_length=20, null=False, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     products = models.ManyToManyField(Product, related_name="orders")
     receipt = models.FileField(null=True, upload_to="orders/receipts")
+    # Kept by update_order_totals only, see save()
+    total_price = models.DecimalField(default=0, max_digits=12, decimal_places=2, editable=False)
+    products_count = models.PositiveIntegerField(default=0, editable=False)
+
+    TOTAL_FIELDS = "total_price", "products_count"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to find the previous owner, see shopapp.signals
+        if "user_id" in instance.__dict__:
+            instance._loaded_user_id = instance.user_id
+        return instance
+
+    def save(self, *, force_insert=False, force_update=False, using=None, update_fields=None):
+        """
+        Save without total_price and products_count unless they are listed in
+        update_fields: the in-memory copy may predate update_order_totals
+        """
+        if update_fields is None and not self._state.adding and not force_insert:
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred and field.name not in self.TOTAL_FIELDS
+            ]
+        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+
+
+def update_order_totals(orders) -> int:
+    """
+    Recompute stored ``total_price`` and ``products_count`` for orders queryset
+    """
+    order_products = (
+        Order.products.through.objects
+        .filter(order_id=OuterRef("pk"))
+        .order_by()
+        .values("order_id")
+    )
+    return orders.update(
+        updated_at=Now(),
+        total_price=Coalesce(
+            Subquery(order_products.annotate(total=Sum("product__price")).values("total")),
+            Value(Decimal(0)),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+        products_count=Coalesce(
+            Subquery(order_products.annotate(count=Count("pk")).values("count")),
+            Value(0),
+        ),
+    )
@@ -0,0 +1,192 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination over any allowed ``?ordering=``, with pk as tie-breaker.
+
+    The cursor stores the ordering values of the last row seen, so every
+    page is one ``WHERE (a, b, pk) > (...) LIMIT n`` query without COUNT
+    or OFFSET. Foreign keys are ordered by their column (``user_id``);
+    nullable fields and lookups across relations are rejected with a 400,
+    as NULLs cannot be compared in the keyset predicate. Orderings should
+    have an ``(field, id)`` index, or deep pages sort the whole table.
+    """
+    unsupported_ordering_message = "Cursor pagination is not supported for ordering by {field}."
+    ordering = "pk"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        fields = OrderingFilter().get_ordering(request, queryset, view)
+        if not fields:
+            fields = list(queryset.query.order_by or queryset.model._meta.ordering or [self.ordering])
+        tie_breaker = "pk"
+        ordering = []
+        for field in fields:
+            if field.lstrip("-") in ("pk", "id"):
+                tie_breaker = "-pk" if field.startswith("-") else "pk"
+                break
+            ordering.append(self.keyset_field(queryset, field))
+        return tuple(ordering) + (tie_breaker,)
+
+    def keyset_field(self, queryset, field: str) -> str:
+        """
+        Column name of ordering field, or a 400 when it cannot be keyset-paginated
+        """
+        name = field.lstrip("-")
+        if name in queryset.query.annotations:
+            return field
+        try:
+            model_field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            model_field = None
+        if model_field is None or not model_field.concrete or model_field.null or model_field.many_to_many:
+            raise ValidationError({"ordering": [self.unsupported_ordering_message.format(field=name)]})
+        return field[:len(field) - len(name)] + model_field.attname
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is not None:
+            self.cursor["p"] = self.clean_position(queryset, self.cursor["p"])
+        reverse = self.cursor is not None and self.cursor["r"]
+
+        ordering = [self.flip(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.after_position(ordering, self.cursor["p"]))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        if self.has_next or self.has_previous:
+            self.display_page_controls = True
+        return self.page
+
+    @staticmethod
+    def flip(field: str) -> str:
+        return field[1:] if field.startswith("-") else "-" + field
+
+    @staticmethod
+    def after_position(ordering, position) -> Q:
+        """
+        Build ``(a > x) | (a == x & b > y) | ...`` for the given ordering
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_position(self, instance):
+        return [getattr(instance, field.lstrip("-")) for field in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor({"p": self.get_position(self.page[-1]), "r": False})
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor({"p": self.get_position(self.page[0]), "r": True})
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(cursor, dict)
+            or cursor.get("o") != list(self.ordering)
+            or not isinstance(cursor.get("p"), list)
+            or len(cursor["p"]) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        cursor["r"] = bool(cursor.get("r"))
+        return cursor
+
+    def clean_position(self, queryset, position) -> list:
+        """
+        Convert cursor values with their fields, a 404 for values that do not fit
+        """
+        values = []
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            if name in queryset.query.annotations:
+                model_field = queryset.query.annotations[name].output_field
+            elif name == "pk":
+                model_field = queryset.model._meta.pk
+            else:
+                model_field = queryset.model._meta.get_field(name)
+            try:
+                value = model_field.to_python(value)
+            except DjangoValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, cursor):
+        cursor = dict(cursor, o=list(self.ordering))
+        data = json.dumps(cursor, cls=DjangoJSONEncoder).encode()
+        encoded = urlsafe_b64encode(data).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class SelectablePaginationMixin:
+    """
+    Switch a viewset to keyset pagination with ``?pagination=cursor``
+    or when a ``cursor`` is passed; set ``cursor_pagination = True``
+    to make it the default for the viewset.
+    """
+    cursor_pagination_class = KeysetCursorPagination
+    cursor_pagination = False
+    pagination_query_param = "pagination"
+
+    def use_cursor_pagination(self) -> bool:
+        params = self.request.query_params
+        if self.cursor_pagination_class.cursor_query_param in params:
+            return True
+        mode = params.get(self.pagination_query_param)
+        if mode is not None:
+            return mode == "cursor"
+        return self.cursor_pagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if self.request is not None and self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
@@ -0,0 +1,35 @@
+from django.db import connections
+from rest_framework.filters import SearchFilter
+
+from mysite.fts import FTSIndex, fts_available
+
+PRODUCT_INDEX = FTSIndex(
+    table="shopapp_product_fts",
+    content_table="shopapp_product",
+    columns=("name", "description"),
+    relation="search_row",
+    weights=(10.0, 1.0),
+)
+
+
+def search_products(queryset, text: str):
+    """
+    Rank products matching text, ``None`` when FTS is not available
+    """
+    if not fts_available(connections[queryset.db]):
+        return None
+    return PRODUCT_INDEX.search(queryset, text)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    SearchFilter backed by an FTS index (``view.search_index``),
+    results are ordered by bm25 unless ``?ordering=`` is given
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        index = getattr(view, "search_index", None)
+        terms = self.get_search_terms(request)
+        if index is None or not terms or not fts_available(connections[queryset.db]):
+            return super().filter_queryset(request, queryset, view)
+        return index.search(queryset, " ".join(terms))
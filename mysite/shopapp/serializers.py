@@ -1,7 +1,69 @@
 from rest_framework import serializers
+from .images import variant_urls
 from .models import Product, Order
 
-class ProductSerializer(serializers.ModelSerializer):
+
+def select_field_names(names, fields=None, omit=None) -> list:
+    """
+    Keep names listed in ``fields`` (when given) and not listed in ``omit``,
+    raises ValidationError for names in ``fields`` that do not exist
+    """
+    names = list(names)
+    if fields:
+        unknown = sorted(set(fields) - set(names))
+        if unknown:
+            raise serializers.ValidationError({"fields": [f"Unknown fields: {', '.join(unknown)}."]})
+    return [
+        name for name in names
+        if (not fields or name in fields) and (not omit or name not in omit)
+    ]
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer trimmed by ``fields`` / ``omit`` sets from its context
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get("fields")
+        omit = self.context.get("omit")
+        if fields or omit:
+            keep = set(select_field_names(self.fields, fields, omit))
+            for name in list(self.fields):
+                if name not in keep:
+                    self.fields.pop(name)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    URLs of the resized variants of an image field, by format and width;
+    the source is the field recording them (see shopapp.images)
+    """
+
+    def __init__(self, image_field: str, **kwargs):
+        self.image_field = image_field
+        self.extra_sources = (image_field,)
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return getattr(instance, self.image_field), super().get_attribute(instance)
+
+    def to_representation(self, value):
+        file, variants = value
+        request = self.context.get("request")
+        urls = variant_urls(file, variants)
+        if request is not None:
+            urls = {
+                fmt: {width: request.build_absolute_uri(url) for width, url in by_width.items()}
+                for fmt, by_width in urls.items()
+            }
+        return urls
+
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    preview_variants = ImageVariantsField(image_field="preview")
+
     class Meta:
         model = Product
         fields = (
@@ -13,9 +75,10 @@ class ProductSerializer(serializers.ModelSerializer):
             "created_at",
             "archived",
             "preview",
+            "preview_variants",
         )
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = (
@@ -23,5 +86,10 @@ class OrderSerializer(serializers.ModelSerializer):
             "promocode",
             "user",
             "products",
-
+            "total_price",
+            "products_count",
+        )
+        read_only_fields = (
+            "total_price",
+            "products_count",
         )
@@ -0,0 +1,126 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from jobsapp.tasks import enqueue
+from mysite.cache_tags import bump_tags
+from mysite.sitemap_files import schedule_rebuild
+from .images import delete_variants
+from .models import Product, ProductImages, Order, update_order_totals, PRODUCTS_TAG, user_orders_tag
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def order_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            update_order_totals(Order.objects.filter(pk=instance.pk))
+            instance.refresh_from_db(fields=["total_price", "products_count"])
+            bump_tags(user_orders_tag(instance.user_id))
+        return
+
+    if action == "pre_clear":
+        instance._cleared_order_ids = list(instance.orders.values_list("pk", flat=True))
+    elif action == "post_clear":
+        update_order_totals(Order.objects.filter(pk__in=instance._cleared_order_ids))
+    elif action in ("post_add", "post_remove"):
+        update_order_totals(Order.objects.filter(pk__in=pk_set))
+
+
+@receiver(pre_save, sender=Product)
+def product_price_pre_save(sender, instance: Product, update_fields=None, **kwargs):
+    instance._price_changed = False
+    if instance._state.adding or (update_fields is not None and "price" not in update_fields):
+        return
+    # The price loaded with the instance (Product.from_db); unknown counts as changed
+    loaded_price = getattr(instance, "_loaded_price", None)
+    instance._price_changed = loaded_price is None or loaded_price != instance.price
+
+
+@receiver(post_save, sender=Product)
+def product_price_post_save(sender, instance: Product, created, **kwargs):
+    if getattr(instance, "_price_changed", False):
+        update_order_totals(Order.objects.filter(products=instance))
+    if "price" in instance.__dict__:
+        instance._loaded_price = instance.price
+
+
+@receiver(pre_save, sender=Product)
+def product_preview_pre_save(sender, instance: Product, **kwargs):
+    # Uncommitted file means a new upload that is written by this save
+    instance._preview_uploaded = bool(instance.preview) and not instance.preview._committed
+    instance._replaced_variants = {}
+    if instance._preview_uploaded:
+        # Variants of the previous preview, the new ones are recorded by the job
+        instance._replaced_variants = instance.preview_variants
+        instance.preview_variants = {}
+
+
+@receiver(post_save, sender=Product)
+def product_preview_post_save(sender, instance: Product, raw=False, **kwargs):
+    if raw or not getattr(instance, "_preview_uploaded", False):
+        return
+    enqueue("shopapp.make_image_variants", names=[instance.preview.name], product_ids=[instance.pk])
+    replaced = instance._replaced_variants
+    if replaced:
+        transaction.on_commit(lambda: delete_variants(replaced))
+
+
+@receiver(post_save, sender=ProductImages)
+def product_image_post_save(sender, instance: ProductImages, created, raw=False, **kwargs):
+    if created and not raw:
+        enqueue("shopapp.make_image_variants", names=[instance.image.name], product_ids=[instance.product_id])
+
+
+@receiver(post_delete, sender=Product)
+def product_variants_post_delete(sender, instance: Product, **kwargs):
+    variants = instance.preview_variants
+    if variants:
+        transaction.on_commit(lambda: delete_variants(variants))
+
+
+@receiver(post_delete, sender=ProductImages)
+def product_image_post_delete(sender, instance: ProductImages, **kwargs):
+    variants = instance.variants
+    if variants:
+        transaction.on_commit(lambda: delete_variants(variants))
+
+
+@receiver(pre_delete, sender=Product)
+def product_pre_delete(sender, instance: Product, **kwargs):
+    instance._order_ids = list(instance.orders.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def product_post_delete(sender, instance: Product, **kwargs):
+    if instance._order_ids:
+        update_order_totals(Order.objects.filter(pk__in=instance._order_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance: Product, raw=False, **kwargs):
+    bump_tags(PRODUCTS_TAG)
+    if not raw:
+        schedule_rebuild("shopapp")
+
+
+@receiver(pre_save, sender=Order)
+def order_pre_save(sender, instance: Order, **kwargs):
+    instance._old_user_id = None
+    if instance._state.adding:
+        return
+    if hasattr(instance, "_loaded_user_id"):
+        # Set by Order.from_db
+        instance._old_user_id = instance._loaded_user_id
+    else:
+        instance._old_user_id = (
+            Order.objects.filter(pk=instance.pk).values_list("user_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance: Order, **kwargs):
+    user_ids = {instance.user_id, getattr(instance, "_old_user_id", None)} - {None}
+    bump_tags(*(user_orders_tag(user_id) for user_id in user_ids))
+    instance._loaded_user_id = instance.user_id
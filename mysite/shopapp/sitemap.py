@@ -7,7 +7,7 @@ class ShopSitemap(Sitemap):
     priority = 0.9
 
     def items(self):
-        return Product.objects.order_by("name")
+        return Product.objects.only("pk", "updated_at").order_by("pk")
 
     def lastmod(self, obj: Product):
-        return obj.created_at
+        return obj.updated_at
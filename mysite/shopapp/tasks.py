@@ -0,0 +1,63 @@
+from django.db.models.functions import Now
+
+from jobsapp.models import Job
+from mysite.cache_tags import bump_tags
+from mysite.sitemap_files import schedule_rebuild
+from jobsapp.tasks import task
+
+from .common import save_csv_products, save_csv_orders
+from .images import make_variants_in_pool
+from .models import Product, PRODUCTS_TAG
+
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def import_csv(job: Job, save_csv, encoding: str) -> dict:
+    # Progress is saved in the chunk's transaction, a requeued job skips committed lines
+    def on_chunk(chunk):
+        job.add_progress(chunk.created + len(chunk.rejected), checkpoint=chunk.last_line)
+
+    resumed_after = job.checkpoint
+    with job.file.open("rb") as csv_file:
+        stats = save_csv(csv_file.file, encoding, on_chunk=on_chunk, after_line=resumed_after)
+    result = stats.as_dict()
+    if resumed_after:
+        result["resumed_after_line"] = resumed_after
+    return result
+
+
+@task("shopapp.import_products_csv")
+def import_products_csv(job: Job, encoding: str) -> dict:
+    return import_csv(job, save_csv_products, encoding)
+
+
+@task("shopapp.import_orders_csv")
+def import_orders_csv(job: Job, encoding: str) -> dict:
+    return import_csv(job, save_csv_orders, encoding)
+
+
+@task("shopapp.set_products_archived")
+def set_products_archived(job: Job, pks: list, archived: bool) -> dict:
+    updated = 0
+    for start in range(0, len(pks), ARCHIVE_BATCH_SIZE):
+        batch = pks[start:start + ARCHIVE_BATCH_SIZE]
+        updated += Product.objects.filter(pk__in=batch).update(archived=archived, updated_at=Now())
+        job.add_progress(len(batch))
+    bump_tags(PRODUCTS_TAG)
+    # The sitemap lists updated_at, which update() does not signal
+    schedule_rebuild("shopapp")
+    return {"updated": updated}
+
+
+@task("shopapp.make_image_variants")
+def make_image_variants(job: Job, names: list, product_ids: list = ()) -> dict:
+    results = make_variants_in_pool(names)
+    job.add_progress(len(results))
+    # Variant URLs are part of the product API responses
+    Product.objects.filter(pk__in=product_ids).update(updated_at=Now())
+    bump_tags(PRODUCTS_TAG)
+    schedule_rebuild("shopapp")
+    errors = {name: str(error) for name, error in results.items() if error is not None}
+    if errors and len(errors) == len(results):
+        raise ValueError(f"No variants made: {errors}")
+    return {"made": len(results) - len(errors), "errors": errors}
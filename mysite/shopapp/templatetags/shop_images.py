@@ -0,0 +1,32 @@
+from django import template
+
+from ..images import VARIANT_FORMATS, variant_urls
+
+register = template.Library()
+
+
+@register.inclusion_tag("shopapp/picture.html")
+def picture(file, width: int = 200, alt: str = "", variants=None):
+    """
+    <picture> with the recorded WebP/JPEG variants of an image, shown ``width`` px wide
+    """
+    urls = variant_urls(file, variants)
+    sources = []
+    for fmt, by_width in urls.items():
+        srcset = ", ".join(f"{url} {variant_width}w" for variant_width, url in sorted(by_width.items()))
+        sources.append({"type": VARIANT_FORMATS[fmt][2], "srcset": srcset})
+
+    jpeg = urls.get("jpeg", {})
+    fitting = [variant_width for variant_width in jpeg if variant_width >= width]
+    if fitting:
+        src = jpeg[min(fitting)]
+    elif file:
+        src = file.url
+    else:
+        src = ""
+    return {
+        "src": src,
+        "sources": sources,
+        "width": width,
+        "alt": alt or (file.name if file else ""),
+    }
@@ -1,14 +1,42 @@
+import gzip
+import json
+import shutil
+from base64 import urlsafe_b64encode
+from decimal import Decimal
+from io import BytesIO, StringIO
 from random import choices
 from string import ascii_letters
 
 from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth.models import User, Permission
 from django.contrib.contenttypes.models import ContentType
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-
-from .models import Product, Order
+from django.utils.http import http_date
+from django.utils.translation import override
+
+from PIL import Image
+from rest_framework.test import APIRequestFactory
+
+from jobsapp.models import Job
+from jobsapp.tasks import run_job
+from .common import save_csv_products, save_csv_orders
+from .images import make_variants, make_variants_in_pool, variant_name, variant_pool
+from mysite import cache_tags
+from mysite.sitemap_files import REBUILD_TASK
+from mysite.test_runner import TEST_CACHES, TEST_MEDIA_ROOT, TEST_SITEMAP_ROOT
+from .models import Product, Order, ProductImages, PRODUCTS_TAG
 from .utils import add_two_number
+from .views import ProductViewSet
 
 class AddTwoNumbersTestCase(TestCase):
     def test_add_two_numbers(self):
@@ -31,6 +59,7 @@ class ProductCreateViewTestCase(TestCase):
     @classmethod
     def tearDownClass(cls):
         cls.user.delete()
+        super().tearDownClass()
 
     def setUp(self):
         self.client.force_login(self.user)
@@ -57,11 +86,13 @@ class ProductCreateViewTestCase(TestCase):
 class ProductDetailsViewTestCase(TestCase):
     @classmethod
     def setUpClass(cls):
+        super().setUpClass()
         cls.product = Product.objects.create(name="Best Product")
 
     @classmethod
     def tearDownClass(csl) -> None:
         csl.product.delete()
+        super().tearDownClass()
 
     def test_get_product(self):
         response = self.client.get(
@@ -95,12 +126,14 @@ class OrderListViewTestCase(TestCase):
 
     @classmethod
     def setUpClass(cls):
+        super().setUpClass()
         cls.user = User.objects.create_user(username="testik",
                                             password="qwerty123")
 
     @classmethod
     def tearDownClass(cls):
         cls.user.delete()
+        super().tearDownClass()
 
     def setUp(self):
         self.client.force_login(self.user)
@@ -138,6 +171,7 @@ class OrderDetailsViewTestCase(TestCase):
     @classmethod
     def tearDownClass(cls) -> None:
         cls.user.delete()
+        super().tearDownClass()
 
     def tearDown(self):
         self.order.delete()
@@ -194,9 +228,7 @@ class OrderExportViewTestCase(TestCase):
     ]
 
     @classmethod
-    def setUpClass(cls):
-        super().setUpClass()
-
+    def setUpTestData(cls):
         cls.user = User.objects.create_user(username="testik",
                                             password="qwerty123",)
         permission = Permission.objects.get(
@@ -207,10 +239,6 @@ class OrderExportViewTestCase(TestCase):
     def setUp(self):
         self.client.force_login(self.user)
 
-    @classmethod
-    def tearDownClass(cls) -> None:
-        cls.user.delete()
-
 
     def test_get_orders_view(self):
         response = self.client.get(
@@ -238,3 +266,748 @@ class OrderExportViewTestCase(TestCase):
             expected_data
         )
 
+
+
+class ProductsDownloadCSVTestCase(TestCase):
+    fixtures = [
+        "products-fixtures.json",
+        "users-fixtures.json",
+    ]
+
+    def test_download_csv_streams_rows(self):
+        with override("en"):
+            response = self.client.get(
+                reverse("shopapp:product-download-cdv"),
+                HTTP_USER_AGENT='Mozilla/5.0'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        lines = content.splitlines()
+        self.assertEqual(lines[0], "name,price,description,discount")
+        self.assertEqual(len(lines), Product.objects.count() + 1)
+        self.assertIn("test,300.00,testtest,10", lines)
+
+
+class ProductsExportFormatsTestCase(TestCase):
+    fixtures = [
+        "products-fixtures.json",
+        "users-fixtures.json",
+    ]
+
+    def get_export(self, **params):
+        with override("en"):
+            return self.client.get(
+                reverse("shopapp:products_export"),
+                params,
+                HTTP_USER_AGENT='Mozilla/5.0'
+            )
+
+    def test_ndjson_export(self):
+        response = self.get_export(format="ndjson")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)["pk"] for line in lines],
+            list(Product.objects.order_by("pk").values_list("pk", flat=True)),
+        )
+
+    def test_keyset_pages(self):
+        first = self.get_export(after_pk=0, limit=1).json()
+        self.assertEqual(len(first["products"]), 1)
+        self.assertEqual(first["products"][0]["price"], "0.00")
+
+        second = self.get_export(after_pk=first["next_after_pk"], limit=1).json()
+        self.assertEqual(second["products"][0]["name"], "test")
+
+        last = self.get_export(after_pk=second["next_after_pk"], limit=1).json()
+        self.assertEqual(last["products"], [])
+        self.assertIsNone(last["next_after_pk"])
+
+    def test_keyset_bad_params(self):
+        response = self.get_export(after_pk="abc")
+        self.assertEqual(response.status_code, 400)
+
+
+class SaveCSVProductsTestCase(TestCase):
+    def test_import_in_chunks_with_rejects(self):
+        csv_file = BytesIO(
+            b"name,description,price,discount,archived\n"
+            b"Lamp,Desk lamp,10.50,5,false\n"
+            b"Chair,,not-a-price,0,\n"
+            b",No name,1,0,\n"
+            b"Table,Oak table,99,,true\n"
+        )
+
+        stats = save_csv_products(csv_file, encoding="utf-8", batch_size=2)
+
+        self.assertEqual(len(stats.chunks), 2)
+        self.assertEqual(stats.created, 2)
+        self.assertEqual([line for line, error in stats.rejected], [3, 4])
+        self.assertIn("price", stats.rejected[0][1])
+        table = Product.objects.get(name="Table")
+        self.assertTrue(table.archived)
+        self.assertEqual(table.discount, 0)
+
+
+class SaveCSVOrdersTestCase(TestCase):
+    fixtures = [
+        "products-fixtures.json",
+        "users-fixtures.json",
+    ]
+
+    def test_import_links_products_per_row(self):
+        csv_file = BytesIO(
+            b'"delivery_address","promocode","user","products"\n'
+            b'"Street 1","SALE","1","1,2"\n'
+            b'"Street 2","","2","2"\n'
+            b'"Street 3","","999","1"\n'
+            b'"Street 4","","1","1,404"\n'
+        )
+
+        with self.assertNumQueries(7):
+            stats = save_csv_orders(csv_file, encoding="utf-8")
+
+        self.assertEqual(stats.created, 2)
+        self.assertEqual([line for line, error in stats.rejected], [4, 5])
+        first = Order.objects.get(delivery_address="Street 1")
+        second = Order.objects.get(delivery_address="Street 2")
+        self.assertEqual(first.user_id, 1)
+        self.assertEqual(first.products_count, 2)
+        self.assertEqual(first.total_price, Decimal("300.00"))
+        self.assertEqual(set(first.products.values_list("pk", flat=True)), {1, 2})
+        self.assertEqual(list(second.products.values_list("pk", flat=True)), [2])
+
+
+class ExportAsCSVMixinTestCase(TestCase):
+    fixtures = [
+        "orders-fixtures.json",
+        "products-fixtures.json",
+        "users-fixtures.json",
+    ]
+
+    def test_export_orders_with_raw_user_ids(self):
+        model_admin = admin.site._registry[Order]
+        queryset = model_admin.get_queryset(None).order_by("pk")
+        with self.assertNumQueries(1):
+            response = model_admin.exropt_csv(None, queryset)
+            lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(
+            lines[0],
+            "id,delivery_address,promocode,created_at,updated_at,user,receipt,total_price,products_count",
+        )
+        first = queryset.first()
+        self.assertTrue(lines[1].startswith(f"{first.pk},"))
+        self.assertIn(f",{first.user_id},", lines[1])
+
+
+class OrderTotalsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="totals", password="qwerty123")
+        self.lamp = Product.objects.create(name="Lamp", price=Decimal("10.00"))
+        self.chair = Product.objects.create(name="Chair", price=Decimal("25.50"))
+        self.order = Order.objects.create(user=self.user)
+
+    def assertTotals(self, order, count, total):
+        order.refresh_from_db()
+        self.assertEqual(order.products_count, count)
+        self.assertEqual(order.total_price, Decimal(total))
+
+    def test_totals_follow_products_changes(self):
+        self.order.products.add(self.lamp, self.chair)
+        self.assertEqual(self.order.total_price, Decimal("35.50"))
+        self.order.save()
+        self.assertTotals(self.order, 2, "35.50")
+
+        self.chair.price = Decimal("30.00")
+        self.chair.save()
+        self.assertTotals(self.order, 2, "40.00")
+
+        self.lamp.orders.remove(self.order)
+        self.assertTotals(self.order, 1, "30.00")
+
+        self.chair.delete()
+        self.assertTotals(self.order, 0, "0")
+
+    def test_stale_order_save_keeps_totals(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.order.products.add(self.lamp)
+
+        stale.delivery_address = "Street 1"
+        stale.save()
+
+        self.assertTotals(self.order, 1, "10.00")
+        self.assertEqual(self.order.delivery_address, "Street 1")
+
+    def test_saves_do_not_select_previous_values(self):
+        self.order.products.add(self.lamp)
+        product = Product.objects.get(pk=self.lamp.pk)
+        order = Order.objects.get(pk=self.order.pk)
+        with CaptureQueriesContext(connection) as context:
+            product.name = "Desk lamp"
+            product.save()
+            order.promocode = "SALE"
+            order.save()
+        selects = [
+            query["sql"] for query in context.captured_queries
+            if query["sql"].startswith("SELECT") and ('FROM "shopapp_product"' in query["sql"] or 'FROM "shopapp_order"' in query["sql"])
+        ]
+        self.assertEqual(selects, [])
+
+        product.price = Decimal("12.00")
+        product.save()
+        self.assertTotals(self.order, 1, "12.00")
+
+    def test_recompute_command_repairs_totals(self):
+        self.order.products.add(self.lamp)
+        Order.objects.update(total_price=0, products_count=0)
+
+        call_command("recompute_order_totals", batch_size=1, stdout=StringIO())
+
+        self.assertTotals(self.order, 1, "10.00")
+
+
+class ProductCursorPaginationTestCase(TestCase):
+    def setUp(self):
+        for index, price in enumerate(["5", "1", "5", "3", "5"]):
+            Product.objects.create(name=f"Product {index}", price=Decimal(price))
+
+    def get_page(self, url, **params):
+        response = self.client.get(url, params, HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_walk_pages_by_price_with_pk_tie_breaker(self):
+        with override("en"):
+            url = reverse("shopapp:product-list")
+        expected = list(
+            Product.objects.order_by("-price", "pk").values_list("pk", flat=True)
+        )
+
+        page = self.get_page(url, pagination="cursor", ordering="-price", page_size=2)
+        self.assertNotIn("count", page)
+        self.assertIsNone(page["previous"])
+        seen = [product["pk"] for product in page["results"]]
+        while page["next"]:
+            page = self.get_page(page["next"])
+            seen += [product["pk"] for product in page["results"]]
+        self.assertEqual(seen, expected)
+
+        previous = self.get_page(page["previous"])
+        self.assertEqual(
+            [product["pk"] for product in previous["results"]],
+            expected[2:4],
+        )
+
+    def test_invalid_cursor(self):
+        with override("en"):
+            url = reverse("shopapp:product-list")
+        response = self.client.get(url, {"cursor": "bad"}, HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_values(self):
+        with override("en"):
+            url = reverse("shopapp:product-list")
+        for position in (["abc", 1], [None, 1], ["5", "x"]):
+            cursor = urlsafe_b64encode(json.dumps({"o": ["-price", "pk"], "p": position, "r": False}).encode())
+            response = self.client.get(
+                url, {"ordering": "-price", "cursor": cursor.decode()}, HTTP_USER_AGENT='Mozilla/5.0',
+            )
+            self.assertEqual(response.status_code, 404, position)
+
+
+class OrderCursorPaginationTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f"buyer{index}", password="qwerty") for index in range(3)]
+        for user in self.users + self.users[:1]:
+            Order.objects.create(user=user, delivery_address=None)
+        with override("en"):
+            self.url = reverse("shopapp:order-list")
+
+    def get(self, url, params=None):
+        return self.client.get(url, params, HTTP_USER_AGENT='Mozilla/5.0')
+
+    def test_walk_pages_by_user(self):
+        response = self.get(self.url, {"pagination": "cursor", "ordering": "-user", "page_size": 1})
+        seen = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            seen += [order["user"] for order in page["results"]]
+            if not page["next"]:
+                break
+            response = self.get(page["next"])
+        self.assertEqual(seen, list(Order.objects.order_by("-user_id", "pk").values_list("user_id", flat=True)))
+
+    def test_nullable_ordering_is_rejected(self):
+        response = self.get(self.url, {"pagination": "cursor", "ordering": "delivery_address"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ordering", response.json())
+
+        response = self.get(self.url, {"ordering": "delivery_address"})
+        self.assertEqual(response.status_code, 200)
+
+
+class ProductFullTextSearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lamp = Product.objects.create(name="Desk lamp", description="Bright light for reading")
+        self.light = Product.objects.create(name="Chair", description="Comes with a lamp holder")
+        Product.objects.create(name="Table", description="Oak")
+
+    def search(self, text):
+        with override("en"):
+            response = self.client.get(
+                reverse("shopapp:product-list"),
+                {"search": text},
+                HTTP_USER_AGENT='Mozilla/5.0',
+            )
+        return [product["pk"] for product in response.json()["results"]]
+
+    def test_ranked_by_bm25_with_name_first(self):
+        self.assertEqual(self.search("lamp"), [self.lamp.pk, self.light.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        Product.objects.filter(pk=self.light.pk).update(description="Plain")
+        self.assertEqual(self.search("lam"), [self.lamp.pk])
+
+        self.lamp.delete()
+        self.assertEqual(self.search("lamp"), [])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search('"desk*)('), [self.lamp.pk])
+
+    def test_match_runs_once_per_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search("lamp"), [self.lamp.pk, self.light.pk])
+        searches = [query["sql"] for query in queries if "MATCH" in query["sql"]]
+        self.assertTrue(searches)
+        for sql in searches:
+            self.assertEqual(sql.count("MATCH"), 1, sql)
+
+    def test_admin_search_keeps_rank_order(self):
+        admin_user = User.objects.create_superuser(username="admin", password="qwerty")
+        self.client.force_login(admin_user)
+        response = self.client.get(
+            reverse("admin:shopapp_product_changelist"), {"q": "lamp"}, HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual([product.pk for product in response.context["cl"].result_list], [self.lamp.pk, self.light.pk])
+
+        # Sorting by a column (price) replaces the rank order
+        Product.objects.filter(pk=self.lamp.pk).update(price=20)
+        Product.objects.filter(pk=self.light.pk).update(price=10)
+        response = self.client.get(
+            reverse("admin:shopapp_product_changelist"), {"q": "lamp", "o": "4"}, HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual([product.pk for product in response.context["cl"].result_list], [self.light.pk, self.lamp.pk])
+
+
+class TaggedCacheInvalidationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="cached", password="qwerty123")
+
+    def get_json(self, name, **kwargs):
+        with override("en"):
+            url = reverse(name, kwargs=kwargs)
+        return self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0').json()
+
+    def test_products_list_reflects_writes(self):
+        Product.objects.create(name="First")
+        self.assertEqual(self.get_json("shopapp:product-list")["count"], 1)
+        self.assertEqual(self.get_json("shopapp:product-list")["count"], 1)
+
+        Product.objects.create(name="Second")
+        self.assertEqual(self.get_json("shopapp:product-list")["count"], 2)
+
+    def test_list_cache_key_ignores_unknown_params(self):
+        def cache_url(query):
+            view = ProductViewSet(action_map={"get": "list"}, format_kwarg=None)
+            view.request = view.initialize_request(APIRequestFactory().get(f"/api/products/?{query}"))
+            return view.get_list_cache_url(view.request)
+
+        url = cache_url("ordering=price&price=10&page=2&fields=name&search=lamp")
+        self.assertEqual(url, cache_url("search=lamp&_=1634&fields=name&page=2&x=1&price=10&ordering=price"))
+        self.assertNotEqual(url, cache_url("ordering=price&price=10&page=3&fields=name&search=lamp"))
+        self.assertEqual(cache_url("price__gte=1&_=1"), cache_url("_=2"))
+
+    def test_tags_are_bumped_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="First")
+            # A reader rebuilding from the pre-commit snapshot caches under this key
+            stale_key = cache_tags.make_key("products", [PRODUCTS_TAG])
+        self.assertNotEqual(cache_tags.make_key("products", [PRODUCTS_TAG]), stale_key)
+
+    def test_user_orders_export_reflects_writes(self):
+        url_kwargs = {"pk": self.user.pk}
+        self.assertEqual(self.get_json("shopapp:users_orders_export", **url_kwargs)["orders"], [])
+
+        order = Order.objects.create(user=self.user, delivery_address="Street 5")
+        orders = self.get_json("shopapp:users_orders_export", **url_kwargs)["orders"]
+        self.assertEqual([data["pk"] for data in orders], [order.pk])
+
+        order.delete()
+        self.assertEqual(self.get_json("shopapp:users_orders_export", **url_kwargs)["orders"], [])
+
+
+class ProductConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Lamp")
+        with override("en"):
+            self.list_url = reverse("shopapp:product-list")
+            self.detail_url = reverse("shopapp:product-detail", kwargs={"pk": self.product.pk})
+
+    def get(self, url, **headers):
+        return self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0', **headers)
+
+    def test_list_not_modified_until_write(self):
+        response = self.get(self.list_url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+
+        with self.assertNumQueries(1):
+            response = self.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Product.objects.create(name="Chair")
+        response = self.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_detail_not_modified_until_write(self):
+        etag = self.get(self.detail_url)["ETag"]
+        self.assertEqual(self.get(self.detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.product.name = "Desk lamp"
+        self.product.save()
+        self.assertEqual(self.get(self.detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_if_modified_since(self):
+        last_modified = self.get(self.detail_url)["Last-Modified"]
+        self.assertEqual(self.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_list_etag_follows_deletes(self):
+        chair = Product.objects.create(name="Chair")
+        etag = self.get(self.list_url)["ETag"]
+        chair.delete()
+        response = self.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # Without an ETag to match, If-Modified-Since alone never gives a 304
+        self.assertEqual(self.get(self.list_url, HTTP_IF_MODIFIED_SINCE=http_date()).status_code, 200)
+
+    def test_missing_detail_is_404(self):
+        with override("en"):
+            url = reverse("shopapp:product-detail", kwargs={"pk": 404})
+        self.assertEqual(self.get(url).status_code, 404)
+
+
+class SparseFieldsetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Product.objects.create(name="Lamp", description="A" * 1000, price=10)
+        with override("en"):
+            self.list_url = reverse("shopapp:product-list")
+
+    def get(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.list_url + query, HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response.status_code, 200)
+        selects = [q["sql"] for q in queries.captured_queries if '"shopapp_product"."name"' in q["sql"]]
+        return response.json()["results"][0], selects[-1]
+
+    def test_fields(self):
+        product, sql = self.get("?fields=pk,name,price")
+        self.assertEqual(set(product), {"pk", "name", "price"})
+        self.assertNotIn('"shopapp_product"."description"', sql)
+
+    def test_omit(self):
+        product, sql = self.get("?omit=description,preview")
+        self.assertNotIn("description", product)
+        self.assertIn("name", product)
+        self.assertNotIn('"shopapp_product"."description"', sql)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(self.list_url + "?fields=name,nope,other", HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"fields": ["Unknown fields: nope, other."]})
+
+
+class OrderApiQueryPlanTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="planner", password="qwerty")
+        cls.products = [Product.objects.create(name=f"Product {i}", price=i) for i in range(3)]
+
+    def setUp(self):
+        with override("en"):
+            self.url = reverse("shopapp:order-list")
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, delivery_address="Street")
+            order.products.set(self.products)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()["results"]
+
+    def test_query_count_does_not_grow_with_page(self):
+        self.add_orders(2)
+        small, _ = self.count_queries()
+        self.add_orders(6)
+        large, results = self.count_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(sorted(results[0]["products"]), sorted(p.pk for p in self.products))
+        self.assertEqual(results[0]["user"], self.user.pk)
+
+
+def make_png(name="photo.png", size=(1200, 800)) -> SimpleUploadedFile:
+    buffer = BytesIO()
+    Image.new("RGBA", size, (200, 100, 50, 255)).save(buffer, format="PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ProductImageVariantsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name="Lamp")
+
+    def test_make_variants(self):
+        name = default_storage.save("products/product_1/preview/photo.png", make_png())
+        variants = make_variants(name)
+
+        self.assertEqual({fmt: sorted(by_width) for fmt, by_width in variants.items()},
+                         {"webp": ["200", "600"], "jpeg": ["200", "600"]})
+        self.assertEqual(variants["webp"]["200"], "products/product_1/preview/variants/photo.png/200.webp")
+        with default_storage.open(variant_name(name, 600, "jpeg")) as file:
+            image = Image.open(file)
+            self.assertEqual((image.format, image.size), ("JPEG", (600, 400)))
+        with default_storage.open(variant_name(name, 200, "webp")) as file:
+            self.assertEqual(Image.open(file).size, (200, 133))
+
+    def test_variants_never_take_other_names(self):
+        upload = make_png("photo_200w.jpg", (50, 50))
+        other = default_storage.save("products/product_1/preview/photo_200w.jpg", upload)
+        desk_png = default_storage.save("products/product_1/preview/desk.png", make_png())
+        desk_gif = default_storage.save("products/product_1/preview/desk.gif", make_png())
+        make_variants(default_storage.save("products/product_1/preview/photo.png", make_png()))
+
+        with default_storage.open(other) as file:
+            self.assertEqual(Image.open(file).size, (50, 50))
+        # Originals differing only in extension keep their own variants
+        png_names = set(make_variants(desk_png)["webp"].values())
+        gif_names = set(make_variants(desk_gif)["webp"].values())
+        self.assertEqual(png_names & gif_names, set())
+
+    def test_old_variants_are_deleted(self):
+        self.product.preview = make_png()
+        self.product.save()
+        make_variants_in_pool([self.product.preview.name])
+        self.product.refresh_from_db()
+        first = self.product.preview_variants["jpeg"]["200"]
+
+        self.product.preview = make_png("other.png")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertFalse(default_storage.exists(first))
+
+        make_variants_in_pool([self.product.preview.name])
+        self.product.refresh_from_db()
+        image = ProductImages.objects.create(product=self.product, image=make_png("photo1.png"))
+        make_variants_in_pool([image.image.name])
+        image.refresh_from_db()
+        names = [self.product.preview_variants["webp"]["600"], image.variants["webp"]["600"]]
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+    def test_upload_enqueues_variants_job(self):
+        image = ProductImages.objects.create(product=self.product, image=make_png())
+        job = Job.objects.get(task="shopapp.make_image_variants")
+        self.assertEqual(job.kwargs["names"], [image.image.name])
+
+        job = run_job(job.pk)
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertTrue(default_storage.exists(variant_name(image.image.name, 200, "jpeg")))
+        image.refresh_from_db()
+        self.assertEqual(image.variants["jpeg"]["200"], variant_name(image.image.name, 200, "jpeg"))
+
+    def test_picture_tag_and_serializer(self):
+        self.product.preview = make_png()
+        self.product.save()
+        template = Template(
+            "{% load shop_images %}{% picture product.preview 200 'Lamp' product.preview_variants %}"
+        )
+        html = template.render(Context({"product": self.product}))
+        self.assertIn(f'<img src="{self.product.preview.url}"', html)
+
+        make_variants_in_pool([self.product.preview.name])
+        self.product.refresh_from_db()
+        html = template.render(Context({"product": self.product}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn("/200.jpg", html)
+
+        with override("en"):
+            url = reverse("shopapp:product-detail", kwargs={"pk": self.product.pk})
+        data = self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0').json()
+        self.assertEqual(set(data["preview_variants"]), {"webp", "jpeg"})
+        self.assertTrue(data["preview_variants"]["webp"]["600"].endswith("/600.webp"))
+
+    def test_backfill_command(self):
+        for index in range(3):
+            ProductImages.objects.create(product=self.product, image=make_png(f"photo{index}.png"))
+        call_command("make_image_variants", workers=2, stdout=StringIO())
+        for image in ProductImages.objects.all():
+            self.assertTrue(default_storage.exists(image.variants["webp"]["600"]))
+
+    def test_pool_is_shared_between_calls(self):
+        names = [ProductImages.objects.create(product=self.product, image=make_png(f"photo{index}.png")).image.name for index in range(2)]
+        self.assertEqual(make_variants_in_pool(names), dict.fromkeys(names))
+        pool = variant_pool()
+        # Variants made again replace the old ones under the same names
+        self.assertEqual(make_variants_in_pool(names), dict.fromkeys(names))
+        self.assertIs(variant_pool(), pool)
+        image = ProductImages.objects.get(image=names[0])
+        self.assertEqual(image.variants["jpeg"]["200"], variant_name(names[0], 200, "jpeg"))
+
+    def test_update_view_ingests_images_in_batch(self):
+        admin = User.objects.create_superuser(username="admin", password="qwerty")
+        self.client.force_login(admin)
+        with override("en"):
+            url = reverse("shopapp:product_update", kwargs={"pk": self.product.pk})
+        files = [make_png(f"photo{index}.png", (50, 50)) for index in range(3)]
+        files.append(SimpleUploadedFile("notes.png", b"not an image"))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                url,
+                {"name": "Lamp", "price": "1", "discount": "0", "description": "", "images": files},
+                HTTP_USER_AGENT='Mozilla/5.0',
+                follow=True,
+            )
+        self.assertEqual(response.status_code, 200)
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "shopapp_productimages"')]
+        self.assertEqual(len(inserts), 1)
+
+        images = self.product.images.all()
+        self.assertEqual(len(images), 3)
+        self.assertTrue(all(default_storage.exists(image.image.name) for image in images))
+        messages = [str(message) for message in response.context["messages"]]
+        self.assertIn("notes.png: Upload a valid image.", messages)
+        self.assertIn("Uploaded 3 of 4 images", messages)
+        job = Job.objects.get(task="shopapp.make_image_variants")
+        self.assertEqual(sorted(job.kwargs["names"]), sorted(image.image.name for image in images))
+
+
+@override_settings(SITEMAP_ROOT=TEST_SITEMAP_ROOT, SITEMAP_BASE_URL="http://shop.test")
+class SitemapFilesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Files built by the previous test would be served instead of the fallback
+        shutil.rmtree(settings.SITEMAP_ROOT, ignore_errors=True)
+        self.product = Product.objects.create(name="Lamp")
+
+    def get(self, url, **headers):
+        return self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0', **headers)
+
+    def rebuild_jobs(self):
+        return Job.objects.filter(task=REBUILD_TASK, status=Job.Status.QUEUED)
+
+    def test_changes_queue_one_rebuild_until_it_starts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Chair")
+            Product.objects.create(name="Table")
+        self.assertEqual([job.kwargs for job in self.rebuild_jobs()], [{"sections": ["shopapp"]}])
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            # Only the insert, the queued rebuild is found in the cache
+            Product.objects.create(name="Desk")
+        self.assertEqual(len(self.rebuild_jobs()), 1)
+
+        run_job(self.rebuild_jobs().get().pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Sofa")
+        self.assertEqual(len(self.rebuild_jobs()), 1)
+
+    def test_import_queues_rebuild(self):
+        csv_file = BytesIO(b"name,price\nLamp,10\nChair,20\n")
+        with self.captureOnCommitCallbacks(execute=True):
+            save_csv_products(csv_file, encoding="utf-8")
+        self.assertEqual(len(self.rebuild_jobs()), 1)
+
+    def test_served_from_database_before_first_build(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.get("/sitemap.xml")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("<loc>http://shop.test/sitemap-shopapp-1.xml</loc>", response.content.decode())
+        self.assertEqual(len(self.rebuild_jobs()), 2)
+
+        response = self.get("/sitemap-shopapp-1.xml")
+        with override("en"):
+            url = "http://shop.test" + self.product.get_absolute_url()
+        self.assertIn(f"<loc>{url}</loc>", response.content.decode())
+        self.assertEqual(self.get("/sitemap-shopapp-2.xml").status_code, 404)
+
+    def test_build_and_serve(self):
+        call_command("build_sitemaps", stdout=StringIO())
+
+        response = self.get("/sitemap.xml")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("<loc>http://shop.test/sitemap-shopapp-1.xml</loc>", response.content.decode())
+
+        response = self.get("/sitemap-shopapp-1.xml", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        with override("en"):
+            url = "http://shop.test" + self.product.get_absolute_url()
+        self.assertIn(f"<loc>{url}</loc>", gzip.decompress(response.content).decode())
+
+        response = self.get("/sitemap-shopapp-1.xml", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unchanged_pages_are_not_rewritten(self):
+        call_command("build_sitemaps", stdout=StringIO())
+        out = StringIO()
+        call_command("build_sitemaps", "shopapp", stdout=out)
+        self.assertIn("shopapp: 1 pages, 0 written", out.getvalue())
+
+        Product.objects.all().delete()
+        call_command("build_sitemaps", "shopapp", stdout=StringIO())
+        self.assertEqual(self.get("/sitemap-shopapp-1.xml").status_code, 404)
+
+
+class LatestProductsFeedTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Product.objects.create(name="Lamp", description="A" * 500)
+        with override("en"):
+            self.url = reverse("shopapp:products-feed")
+
+    def get(self, **headers):
+        return self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0', **headers)
+
+    def test_feed_cached_until_product_saved(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        Product.objects.create(name="Zebra lamp")
+        response = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Zebra lamp", response.content.decode())
+
+
+class TestCacheIsolationTestCase(TestCase):
+    def test_tests_do_not_use_shared_cache(self):
+        self.assertEqual(settings.CACHES, TEST_CACHES)
+        self.assertIsInstance(caches["default"], LocMemCache)
@@ -4,15 +4,15 @@ View func for shop.
 For products, orders, ...
 """
 from timeit import default_timer
+from django.contrib import messages
 from django.contrib.auth.models import Group, User
 from django.contrib.syndication.views import Feed
-from django.core.cache import cache
-from django.http import HttpRequest, HttpResponseRedirect, JsonResponse, HttpResponse
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.functions import Substr
+from django.http import HttpRequest, HttpResponseRedirect, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.urls import reverse_lazy
-from django.utils.decorators import method_decorator
 from django.views import View
-from django.views.decorators.cache import cache_page
 from django.views.generic import (ListView,
                                   DetailView,
                                   CreateView,
@@ -22,33 +22,41 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from yaml import serialize
 
-from .common import save_csv_products
+from .common import (save_csv_products,
+                     iter_csv_rows,
+                     iter_ndjson_rows,
+                     parse_keyset_params,
+                     keyset_page)
 from .forms import ProductForm, GroupForm
-from .models import Product, Order, ProductImages
+from .images import ingest_product_images
+from mysite import cache_tags
+from mysite.feeds import CachedFeedMixin
+from mysite.query_planner import QueryPlannerMixin
+from .models import Product, Order, PRODUCTS_TAG, user_orders_tag
+from .mixins import ConditionalGetMixin, CachedListMixin, SparseFieldsetViewMixin
+from .pagination import SelectablePaginationMixin
+from .search import PRODUCT_INDEX, FullTextSearchFilter
 from .serializers import ProductSerializer, OrderSerializer
 from django.contrib.auth.mixins import (LoginRequiredMixin,
                                         PermissionRequiredMixin,
                                         UserPassesTestMixin)
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 import logging
 from rest_framework.decorators import action
 from rest_framework.request import Request
-from csv import DictWriter
 
 log = logging.getLogger(__name__)
 
 class UserOrdersExportView(View):
     def get(self, request: HttpRequest, pk):
-        cache_key = f"{pk}_user_orders_data_cache"
-        orders_data = cache.get(cache_key)
         user = get_object_or_404(User, pk=pk)
-        if orders_data is None:
-            orders = Order.objects.filter(user=user)
 
-            orders_data = [
+        def get_orders_data():
+            orders = Order.objects.filter(user=user)
+            return [
                 {
                     "pk": order.pk,
                     "delivery_address": order.delivery_address,
@@ -56,8 +64,12 @@ class UserOrdersExportView(View):
                 }
                 for order in orders
             ]
-            cache.set(cache_key, orders_data, 300)
 
+        orders_data = cache_tags.get_or_set(
+            f"{pk}_user_orders_data_cache",
+            [user_orders_tag(user.pk)],
+            get_orders_data,
+        )
         return JsonResponse({"user_id": user.pk, "orders": orders_data})
 
 
@@ -77,14 +89,17 @@ class UserOrdersListView(ListView):
         return context
 
 
-class LatestProductsFeed(Feed):
+class LatestProductsFeed(CachedFeedMixin, Feed):
     title = "Products (latest)"
     description = 'Update of changes and additions products'
     link = reverse_lazy("shopapp:products_list")
+    cache_tags = [PRODUCTS_TAG]
 
     def items(self):
         return (
             Product.objects
+            .only("pk", "name")
+            .annotate(description_preview=Substr("description", 1, 100))
             .order_by("-name")[:5]
         )
 
@@ -92,10 +107,14 @@ class LatestProductsFeed(Feed):
         return item.name
 
     def item_description(self, item):
-        return item.description[:100]
+        return item.description_preview
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(ConditionalGetMixin,
+                   SparseFieldsetViewMixin,
+                   QueryPlannerMixin,
+                   SelectablePaginationMixin,
+                   ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     filter_backends = [
@@ -108,13 +127,24 @@ class OrderViewSet(ModelViewSet):
         "user",
         "products",
     ]
+    filterset_fields = {
+        "total_price": ["exact", "gte", "lte"],
+        "products_count": ["exact", "gte", "lte"],
+    }
     ordering_fields = [
         "delivery_address",
         "user",
+        "total_price",
+        "products_count",
     ]
 
 @extend_schema(description="Products Views CRUD")
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ConditionalGetMixin,
+                     CachedListMixin,
+                     SparseFieldsetViewMixin,
+                     QueryPlannerMixin,
+                     SelectablePaginationMixin,
+                     ModelViewSet):
     """
     Set View for change Product
     Same info
@@ -122,7 +152,7 @@ class ProductViewSet(ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     filter_backends = [
-        SearchFilter,
+        FullTextSearchFilter,
         DjangoFilterBackend,
         OrderingFilter,
     ]
@@ -138,21 +168,17 @@ class ProductViewSet(ModelViewSet):
         "name",
         "description",
     ]
+    search_index = PRODUCT_INDEX
+    list_cache_name = "products_api_list"
+    list_cache_tags = [PRODUCTS_TAG]
     ordering_fields = [
         "name",
         "price",
         "discount",
     ]
-    @method_decorator(cache_page(120))
-    def list(self, *args, **kwargs):
-        # print("HELLO PRODUCT LIST")
-        return super().list(*args, **kwargs)
-
     @action(methods=["get"], detail=False)
     def download_cdv(self, request: Request):
-        response = HttpResponse(content_type="text/csv")
         filename = "products-export.csv"
-        response["Contrnt-Disposition"] = f"attachment; filename = {filename}"
         queryset = self.filter_queryset(self.get_queryset())
         fields = [
             "name",
@@ -160,16 +186,11 @@ class ProductViewSet(ModelViewSet):
             "description",
             "discount",
         ]
-        queryset = queryset.only(*fields)
-        writer = DictWriter(response, fieldnames=fields)
-        writer.writeheader()
-
-        for product in queryset:
-            writer.writerow({
-                field: getattr(product, field)
-                for field in fields
-            })
-
+        response = StreamingHttpResponse(
+            iter_csv_rows(queryset, fields),
+            content_type="text/csv",
+        )
+        response["Content-Disposition"] = f"attachment; filename={filename}"
         return response
 
     @action(
@@ -178,12 +199,11 @@ class ProductViewSet(ModelViewSet):
         parser_classes=[MultiPartParser],
     )
     def upload_csv(self, request: Request):
-        products = save_csv_products(
+        stats = save_csv_products(
             request.FILES["file"].file,
             encoding=request.encoding,
         )
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return Response(stats.as_dict())
 
     @extend_schema(
         summary="Get one product by id",
@@ -285,11 +305,13 @@ class ProductUpdateView(UserPassesTestMixin, UpdateView):
         )
 
     def form_valid(self, form):
-        for img in form.files.getlist("images"):
-            ProductImages.objects.create(
-                product=self.object,
-                image=img
-            )
+        results = ingest_product_images(self.object, form.files.getlist("images"))
+        for result in results:
+            if result.error:
+                messages.error(self.request, f"{result.name}: {result.error}")
+        stored = sum(1 for result in results if result.stored)
+        if stored:
+            messages.success(self.request, f"Uploaded {stored} of {len(results)} images")
         return super().form_valid(form)
 
 
@@ -344,13 +366,71 @@ class OrderDeleteView(DeleteView):
     success_url = reverse_lazy("shopapp:order_list")
 
 
-class ProductsExportView(View):
-    def get(self, request: HttpRequest) -> JsonResponse:
-        cache_key = "products_data_export"
-        products_data = cache.get(cache_key)
-        if products_data is None:
+class ExportViewMixin:
+    """
+    Alternative export formats for the JSON export views.
+
+    ``?format=ndjson`` streams one object per line,
+    ``?after_pk=&limit=`` returns one page ordered by pk. The rows come
+    from ``export_queryset`` or all objects of ``model``.
+    """
+    model = None
+    export_queryset = None
+    export_key = None
+    export_fields = None
+
+    def get_export_queryset(self):
+        if self.export_queryset is not None:
+            queryset = self.export_queryset.all()
+        elif self.model is not None:
+            queryset = self.model._default_manager.all()
+        else:
+            raise ImproperlyConfigured(
+                "%(cls)s is missing a QuerySet. Define %(cls)s.export_queryset "
+                "or override get_export_queryset()." % {"cls": self.__class__.__name__}
+            )
+        return queryset.order_by("pk")
+
+    def export(self, request: HttpRequest):
+        try:
+            keyset = parse_keyset_params(request.GET)
+        except ValueError:
+            return JsonResponse({"error": "Invalid after_pk or limit"}, status=400)
+
+        queryset = self.get_export_queryset()
+        if keyset is not None:
+            queryset = keyset_page(queryset, *keyset)
+
+        if request.GET.get("format") == "ndjson":
+            return StreamingHttpResponse(
+                iter_ndjson_rows(queryset, self.export_fields),
+                content_type="application/x-ndjson",
+            )
+
+        if keyset is None:
+            return None
+
+        rows = list(queryset.values(*self.export_fields))
+        next_after_pk = rows[-1]["pk"] if len(rows) == keyset[1] else None
+        return JsonResponse({
+            self.export_key: rows,
+            "next_after_pk": next_after_pk,
+        })
+
+
+class ProductsExportView(ExportViewMixin, View):
+    model = Product
+    export_key = "products"
+    export_fields = "pk", "name", "price", "archived"
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        response = self.export(request)
+        if response is not None:
+            return response
+
+        def get_products_data():
             products = Product.objects.order_by("pk").all()
-            products_data = [
+            return [
                 {
                     "pk": product.pk,
                     "name": product.name,
@@ -359,7 +439,12 @@ class ProductsExportView(View):
                 }
                 for product in products
             ]
-            cache.set(cache_key, products_data, 300)
+
+        products_data = cache_tags.get_or_set(
+            "products_data_export",
+            [PRODUCTS_TAG],
+            get_products_data,
+        )
         # elem = products_data[0]
         # name = elem["nae"]
         # print("name:", name)
@@ -367,11 +452,19 @@ class ProductsExportView(View):
         return JsonResponse({"products":products_data})
 
 
-class OrdersExportView(UserPassesTestMixin, View):
+class OrdersExportView(UserPassesTestMixin, ExportViewMixin, View):
+    model = Order
+    export_key = "orders"
+    export_fields = "pk", "delivery_address"
+
     def test_func(self):
         return self.request.user.is_staff
 
-    def get(self, request: HttpRequest) -> JsonResponse:
+    def get(self, request: HttpRequest) -> HttpResponse:
+        response = self.export(request)
+        if response is not None:
+            return response
+
         orders = Order.objects.order_by("pk")
 
         orders_data = [
@@ -381,4 +474,4 @@ class OrdersExportView(UserPassesTestMixin, View):
             }
             for order in orders
         ]
-        return JsonResponse({"orders":orders_data})
\ No newline at end of file
+        return JsonResponse({"orders":orders_data})